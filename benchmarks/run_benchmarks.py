@@ -0,0 +1,211 @@
+"""Throughput benchmarks for the organizer stages and the full pipeline.
+
+Generates (or reuses) a synthetic corpus per size, then runs each benchmark
+in a fresh subprocess so its peak RSS is measured on its own, and reports
+files/s, MB/s and peak RSS. Results are saved as JSON and can be compared
+with an earlier run:
+
+    python benchmarks/run_benchmarks.py --sizes 200,2000 --label before
+    python benchmarks/run_benchmarks.py --sizes 200,2000 --compare benchmarks/results/before.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "src"))
+
+from synthetic_corpus import generate_corpus  # noqa: E402
+
+# Where corpora are generated and results are saved by default
+CORPUS_DIR = os.path.join(tempfile.gettempdir(), "organizer_bench_corpus")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+DEFAULT_SIZES = "200,1000"
+
+# Benchmarks in the order they run: single stages first, then the full pipeline
+BENCHMARKS = ["scan", "exif", "probe", "probe_fingerprint", "pipeline", "pipeline_dry_run"]
+
+
+def _candidates(corpus):
+    from media_scanner import scan_media_files
+    return list(scan_media_files(corpus))
+
+
+def _bench_scan(corpus, target, workers):
+    candidates = _candidates(corpus)
+    return len(candidates), 0
+
+
+def _bench_exif(corpus, target, workers):
+    from exif_reader import read_exif_date
+    count = 0
+    for path, _, media_type in _candidates(corpus):
+        if media_type == "image":
+            with open(path, "rb") as f:
+                read_exif_date(f)
+            count += 1
+    return count, 0
+
+
+def _bench_probe(corpus, target, workers, compute_fingerprint=False):
+    from media_probe import iter_probed_media
+    count = 0
+    size = 0
+    for _, info in iter_probed_media(_candidates(corpus), compute_fingerprint, workers=workers):
+        count += 1
+        size += info.size or 0
+    return count, size
+
+
+def _bench_probe_fingerprint(corpus, target, workers):
+    return _bench_probe(corpus, target, workers, compute_fingerprint=True)
+
+
+def _bench_pipeline(corpus, target, workers, dry_run=False):
+    from organizer_engine import MediaOrganizer, OrganizeOptions
+    options = OrganizeOptions(corpus, target, workers=workers, dry_run=dry_run, use_cache=False)
+    stats = MediaOrganizer(options).run()
+    # The pipeline reads the whole corpus, run_one sizes it outside the timing
+    return stats["total_files"], None
+
+
+def _bench_pipeline_dry_run(corpus, target, workers):
+    return _bench_pipeline(corpus, target, workers, dry_run=True)
+
+
+def _peak_rss_bytes():
+    """Peak RSS of this process and of its finished children (the probe pool)."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    scale = 1 if sys.platform == "darwin" else 1024
+    return max(own, children) * scale
+
+
+def run_one(name, corpus, workers):
+    """Run a single benchmark in this process and return its result dict."""
+    target = tempfile.mkdtemp(prefix="organizer_bench_target_")
+    try:
+        started = time.perf_counter()
+        files, size = globals()["_bench_" + name](corpus, target, workers)
+        seconds = time.perf_counter() - started
+    finally:
+        shutil.rmtree(target, ignore_errors=True)
+    if size is None:
+        size = sum(os.path.getsize(path) for path, _, _ in _candidates(corpus))
+    return {
+        "benchmark": name,
+        "files": files,
+        "bytes": size,
+        "seconds": round(seconds, 4),
+        "files_per_second": round(files / seconds, 2) if seconds else 0.0,
+        "mb_per_second": round(size / seconds / (1024 * 1024), 2) if seconds and size else 0.0,
+        "peak_rss_mb": round(_peak_rss_bytes() / (1024 * 1024), 1),
+    }
+
+
+def run_isolated(name, corpus, workers):
+    """Run a benchmark in a subprocess so peak RSS only covers that benchmark."""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-one", name, "--corpus", corpus,
+         "--workers", str(workers)],
+        check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=BENCHMARKS_DIR,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _print_results(results, baseline=None):
+    previous = {}
+    for result in (baseline or {}).get("results", ()):
+        previous[(result["size"], result["benchmark"])] = result
+
+    print(f"{'size':>7} {'benchmark':<18} {'files/s':>10} {'MB/s':>8} {'peak RSS MB':>12}"
+          + ("  vs baseline" if baseline else ""))
+    for result in results:
+        line = (f"{result['size']:>7} {result['benchmark']:<18} {result['files_per_second']:>10.1f} "
+                f"{result['mb_per_second']:>8.1f} {result['peak_rss_mb']:>12.1f}")
+        old = previous.get((result["size"], result["benchmark"]))
+        if old and old["files_per_second"]:
+            line += f"  {result['files_per_second'] / old['files_per_second']:.2f}x files/s"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the photo & video organizer.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated corpus sizes (default: %(default)s)")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS),
+                        help="comma separated benchmarks to run (default: all)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for probing (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="corpus seed (default: 0)")
+    parser.add_argument("--corpus-dir", default=CORPUS_DIR, help="where corpora are kept (default: %(default)s)")
+    parser.add_argument("--results-dir", default=RESULTS_DIR, help="where results are saved (default: %(default)s)")
+    parser.add_argument("--label", help="name of the results file (default: git version and time)")
+    parser.add_argument("--compare", metavar="RESULTS", help="earlier results file to compare with")
+    # Internal: run a single benchmark and print its result as JSON
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args.corpus, args.workers)))
+        return 0
+
+    names = [name for name in args.benchmarks.split(",") if name]
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(sorted(unknown)))
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(",") if size]:
+        corpus = os.path.join(args.corpus_dir, f"n{size}_seed{args.seed}")
+        print(f"Preparing corpus of {size} files in {corpus}", file=sys.stderr)
+        manifest = generate_corpus(corpus, size, args.seed)
+        for name in names:
+            print(f"  {name}", file=sys.stderr)
+            result = run_isolated(name, corpus, args.workers)
+            result.update(size=size, corpus_bytes=manifest["bytes"])
+            results.append(result)
+
+    version = _git_version()
+    report = {
+        "version": version,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": args.workers,
+        "seed": args.seed,
+        "results": results,
+    }
+    label = args.label or "%s_%s" % (version or "unknown", time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(args.results_dir, exist_ok=True)
+    results_path = os.path.join(args.results_dir, label + ".json")
+    with open(results_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_results(results, baseline)
+    print(f"Results saved to {results_path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
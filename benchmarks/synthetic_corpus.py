@@ -0,0 +1,137 @@
+"""Deterministic synthetic media corpus for the benchmarks.
+
+The same count and seed always produce the same files (contents, names and
+timestamps), so runs of different versions work on identical input. The mix
+is roughly what a phone or camera dump looks like: JPEGs with and without
+EXIF dates, some PNGs, recompressed near-duplicates, byte-identical copies
+and a few short videos.
+"""
+import os
+import json
+import time
+import shutil
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Bump when the generated files change, so cached corpora are regenerated
+CORPUS_VERSION = 1
+
+# Marker written once a corpus directory is complete
+MANIFEST_FILENAME = "corpus.json"
+
+IMAGE_SIZE = (640, 480)
+VIDEO_SIZE = (160, 120)
+VIDEO_FRAMES = 48
+VIDEO_FPS = 24
+
+# Share of each kind of file, per 100 files
+MIX = [
+    ("jpeg_exif", 45),
+    ("jpeg_plain", 15),
+    ("png", 10),
+    ("recompressed", 12),
+    ("exact_copy", 15),
+    ("video", 3),
+]
+
+# Base timestamp for mtimes and EXIF dates (2019-01-01 UTC)
+BASE_TIME = 1546300800
+
+
+def _pattern(rng, size):
+    """A smooth random picture, so perceptual hashes differ between pictures."""
+    width, height = size
+    low = rng.randint(0, 256, size=(6, 8, 3)).astype(np.uint8)
+    image = cv2.resize(low, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(4):
+        center = (int(rng.randint(0, width)), int(rng.randint(0, height)))
+        color = tuple(int(c) for c in rng.randint(0, 256, size=3))
+        cv2.circle(image, center, int(rng.randint(10, height // 3)), color, -1)
+    noise = rng.randint(0, 12, size=image.shape).astype(np.uint8)
+    return cv2.add(image, noise)
+
+
+def _exif_with_date(timestamp):
+    exif = Image.Exif()
+    date = time.strftime("%Y:%m:%d %H:%M:%S", time.gmtime(timestamp))
+    exif[0x0132] = date  # DateTime
+    exif.get_ifd(0x8769)[0x9003] = date  # DateTimeOriginal
+    return exif
+
+
+def _write_video(path, rng):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), VIDEO_FPS, VIDEO_SIZE)
+    base = _pattern(rng, VIDEO_SIZE)
+    for frame_number in range(VIDEO_FRAMES):
+        writer.write(np.roll(base, frame_number * 2, axis=1))
+    writer.release()
+
+
+def generate_corpus(directory, count, seed=0):
+    """Create count media files in directory and return the manifest dict.
+
+    If the directory already holds a complete corpus of the same count, seed
+    and version it is reused.
+    """
+    manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+    wanted = {"version": CORPUS_VERSION, "count": count, "seed": seed}
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if all(manifest.get(key) == value for key, value in wanted.items()):
+            return manifest
+    except (OSError, ValueError):
+        pass
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    rng = np.random.RandomState(seed)
+    kinds = [kind for kind, share in MIX for _ in range(share)]
+    originals = []
+    counts = {}
+    total_bytes = 0
+
+    for index in range(count):
+        kind = kinds[index % len(kinds)]
+        if kind in ("recompressed", "exact_copy") and not originals:
+            kind = "jpeg_exif"
+        # Spread files over a few folders like camera dumps
+        folder = os.path.join(directory, "DCIM", "%03d" % (index // 250))
+        os.makedirs(folder, exist_ok=True)
+        timestamp = BASE_TIME + index * 3607
+        name = "IMG_%06d" % index
+
+        if kind == "jpeg_exif":
+            path = os.path.join(folder, name + ".jpg")
+            Image.fromarray(_pattern(rng, IMAGE_SIZE)).save(path, quality=90, exif=_exif_with_date(timestamp))
+            originals.append(path)
+        elif kind == "jpeg_plain":
+            path = os.path.join(folder, name + ".jpg")
+            Image.fromarray(_pattern(rng, IMAGE_SIZE)).save(path, quality=90)
+            originals.append(path)
+        elif kind == "png":
+            path = os.path.join(folder, name + ".png")
+            Image.fromarray(_pattern(rng, IMAGE_SIZE)).save(path)
+        elif kind == "recompressed":
+            source = originals[rng.randint(len(originals))]
+            path = os.path.join(folder, name + "_small.jpg")
+            with Image.open(source) as img:
+                img.resize((IMAGE_SIZE[0] // 2, IMAGE_SIZE[1] // 2)).save(path, quality=60)
+        elif kind == "exact_copy":
+            source = originals[rng.randint(len(originals))]
+            path = os.path.join(folder, name + "_copy" + os.path.splitext(source)[1])
+            shutil.copyfile(source, path)
+        else:
+            path = os.path.join(folder, "VID_%06d.avi" % index)
+            _write_video(path, rng)
+
+        os.utime(path, (timestamp, timestamp))
+        counts[kind] = counts.get(kind, 0) + 1
+        total_bytes += os.path.getsize(path)
+
+    manifest = dict(wanted, kinds=counts, bytes=total_bytes)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
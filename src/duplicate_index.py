@@ -0,0 +1,323 @@
+import os
+import hashlib
+from array import array
+
+import numpy as np
+
+
+if hasattr(int, "bit_count"):
+    def hamming_distance(a, b):
+        """Number of differing bits between two integer hashes."""
+        return (a ^ b).bit_count()
+else:
+    def hamming_distance(a, b):
+        """Number of differing bits between two integer hashes."""
+        return bin(a ^ b).count("1")
+
+
+def hash_to_int(fingerprint):
+    """Convert a hex fingerprint (as produced by imagehash) into an integer."""
+    return int(fingerprint, 16)
+
+
+def parse_fingerprint(fingerprint):
+    """Split a fingerprint into its 64-bit frame hashes.
+
+    Photos have a single hex hash, videos one hash per sampled frame joined by "-".
+    """
+    return tuple(hash_to_int(part) for part in fingerprint.split("-"))
+
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _BYTE_BITS[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class PathTable:
+    """Paths stored once and referred to by integer ids.
+
+    All paths live encoded in a single buffer with an array of offsets, which
+    takes the length of the path plus 8 bytes each instead of the ~60 byte
+    overhead of a Python string. Adding the same path twice in a row returns
+    the same id, which covers the usual case of a file being registered in
+    the exact and the perceptual index one after the other.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+        self.last_path = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, path):
+        """Store a path and return its id."""
+        if path == self.last_path:
+            return len(self.offsets) - 2
+        self.data += os.fsencode(path)
+        self.offsets.append(len(self.data))
+        self.last_path = path
+        return len(self.offsets) - 2
+
+    def __getitem__(self, path_id):
+        return os.fsdecode(bytes(self.data[self.offsets[path_id]:self.offsets[path_id + 1]]))
+
+
+class MultiIndexHash:
+    """Radius search over 64-bit hashes using multi-index hashing.
+
+    Each hash is split into four 16-bit blocks. If two hashes differ in at
+    most r bits, enough blocks differ in at most r // 4 bits (pigeonhole)
+    that a search only has to probe the block values within that smaller
+    radius and verify the few candidates it finds.
+
+    Hashes are kept in a uint64 array. Per block, a sorted array of block
+    values with a parallel array of hash ids is binary searched; hashes added
+    since the last merge are few and simply compared one by one, and are
+    merged into the sorted arrays in batches. That is 8 bytes per hash plus
+    6 bytes per block, 32 bytes in total.
+    """
+
+    BLOCKS = 4
+    BLOCK_BITS = 16
+    BLOCK_MASK = (1 << BLOCK_BITS) - 1
+    # Hashes added since the last merge that are compared one by one
+    MERGE_EVERY = 4096
+
+    def __init__(self):
+        self.hashes = np.zeros(self.MERGE_EVERY, dtype=np.uint64)
+        self.count = 0
+        # Number of hashes that are in the sorted block arrays
+        self.merged = 0
+        self.block_keys = [np.zeros(0, dtype=np.uint16) for _ in range(self.BLOCKS)]
+        self.block_ids = [np.zeros(0, dtype=np.uint32) for _ in range(self.BLOCKS)]
+        self._flip_masks = {}
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        """Add a hash and return its id."""
+        if self.count == len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.zeros(len(self.hashes), dtype=np.uint64)])
+        self.hashes[self.count] = value
+        self.count += 1
+        if self.count - self.merged >= self.MERGE_EVERY:
+            self._merge()
+        return self.count - 1
+
+    def _merge(self):
+        new_hashes = self.hashes[self.merged:self.count]
+        new_ids = np.arange(self.merged, self.count, dtype=np.uint32)
+        for block in range(self.BLOCKS):
+            keys = ((new_hashes >> np.uint64(block * self.BLOCK_BITS)) & np.uint64(self.BLOCK_MASK)).astype(np.uint16)
+            order = np.argsort(keys, kind="stable")
+            keys = keys[order]
+            # Inserting after equal keys keeps the ids of each key in insertion order
+            positions = np.searchsorted(self.block_keys[block], keys, side="right")
+            self.block_keys[block] = np.insert(self.block_keys[block], positions, keys)
+            self.block_ids[block] = np.insert(self.block_ids[block], positions, new_ids[order])
+        self.merged = self.count
+
+    def find_within(self, value, radius):
+        """Return [(distance, hash_id), ...] for every hash within radius, closest first."""
+        value = np.uint64(value)
+        block_radius = radius // self.BLOCKS
+        # At most this many blocks can differ in more than block_radius bits
+        far_blocks = min(self.BLOCKS - 1, radius // (block_radius + 1))
+        flips = self._block_flips(block_radius)
+
+        # Hashes added since the last merge are compared directly
+        distances = _popcount(self.hashes[self.merged:self.count] ^ value)
+        close = np.flatnonzero(distances <= radius)
+        matches = list(zip(distances[close].tolist(), (close + self.merged).tolist()))
+
+        candidates = []
+        for block in range(far_blocks + 1):
+            keys = self.block_keys[block]
+            if not len(keys):
+                break
+            key = (int(value) >> (block * self.BLOCK_BITS)) & self.BLOCK_MASK
+            probes = flips ^ np.uint16(key)
+            starts = np.searchsorted(keys, probes, side="left")
+            ends = np.searchsorted(keys, probes, side="right")
+            hit = starts < ends
+            for start, end in zip(starts[hit].tolist(), ends[hit].tolist()):
+                candidates.append(self.block_ids[block][start:end])
+
+        if candidates:
+            hash_ids = np.unique(np.concatenate(candidates))
+            distances = _popcount(self.hashes[hash_ids] ^ value)
+            close = distances <= radius
+            matches.extend(zip(distances[close].tolist(), hash_ids[close].tolist()))
+        matches.sort()
+        return matches
+
+    def _block_flips(self, block_radius):
+        """All 16-bit masks with at most block_radius bits set."""
+        masks = self._flip_masks.get(block_radius)
+        if masks is None:
+            masks = np.array([mask for mask in range(1 << self.BLOCK_BITS)
+                              if hamming_distance(mask, 0) <= block_radius], dtype=np.uint16)
+            self._flip_masks[block_radius] = masks
+        return masks
+
+
+class DuplicateIndex:
+    """Find previously seen media with a matching fingerprint.
+
+    Any fingerprint within threshold differing bits counts as a duplicate,
+    threshold 0 only matches identical fingerprints. Video fingerprints hold
+    one hash per sampled frame: the middle frame is indexed, and a match
+    requires the same number of frames with every frame within the threshold.
+
+    Memory per photo is the 32 bytes of the multi-index hash plus a 4 byte
+    path id, and the path itself in the shared PathTable. Videos also keep
+    their frame hashes in a tuple, but they are few.
+    """
+
+    def __init__(self, threshold=0, paths=None):
+        self.threshold = threshold
+        self.paths = paths if paths is not None else PathTable()
+        self.tree = MultiIndexHash()
+        # hash id -> path id
+        self.path_ids = array("I")
+        # hash id -> all frame hashes, for fingerprints with more than one frame
+        self.frames = {}
+
+    def __len__(self):
+        return len(self.tree)
+
+    def find(self, fingerprint):
+        """Return the path stored for a matching fingerprint, or None."""
+        frames = parse_fingerprint(fingerprint)
+        for _, hash_id in self.tree.find_within(frames[len(frames) // 2], self.threshold):
+            other_frames = self.frames.get(hash_id, (int(self.tree.hashes[hash_id]),))
+            if len(other_frames) == len(frames) and all(
+                    hamming_distance(a, b) <= self.threshold for a, b in zip(frames, other_frames)):
+                return self.paths[self.path_ids[hash_id]]
+        return None
+
+    def add(self, fingerprint, path):
+        frames = parse_fingerprint(fingerprint)
+        hash_id = self.tree.add(frames[len(frames) // 2])
+        self.path_ids.append(self.paths.add(path))
+        if len(frames) > 1:
+            self.frames[hash_id] = frames
+
+
+# How much of the head and tail of a file the partial hash covers
+PARTIAL_HASH_BYTES = 4096
+FULL_HASH_CHUNK = 1024 * 1024
+
+
+class ExactDuplicateIndex:
+    """Find byte-identical files without decoding them, in the style of fdupes.
+
+    Files are grouped by size first. Only when a size is shared do we hash the
+    first and last few KB, and only when those match too do we hash the whole
+    file. A file whose size is unique is never read at all, and digests are
+    computed at most once per file. A size seen once costs a dict slot and a
+    path id; digest entries are only kept for sizes that are shared.
+    """
+
+    def __init__(self, paths=None):
+        self.paths = paths if paths is not None else PathTable()
+        # Bytes read for digests so far
+        self.bytes_read = 0
+        # size -> path id of the only file of that size, or
+        # size -> [[path id, partial_digest, full_digest], ...] once the size is shared
+        self.by_size = {}
+        # size -> [[path, partial_digest, full_digest], ...] of files still being probed
+        self.reserved = {}
+
+    def lookup(self, path, size):
+        """Return (original_path or None, entry) for a file that is about to be processed.
+
+        Pass the entry to add() once the file is known to be valid media, so
+        later copies can match it without recomputing its digests. The
+        original may also be a reserved file whose probe hasn't finished.
+        """
+        entry = [path, None, None]
+        existing_entries = self.by_size.get(size)
+        if isinstance(existing_entries, int):
+            existing_entries = self.by_size[size] = [[existing_entries, None, None]]
+
+        for existing in existing_entries or ():
+            existing_path = self.paths[existing[0]]
+            if self._same(existing_path, existing, path, entry, size):
+                return existing_path, entry
+        for existing in self.reserved.get(size, ()):
+            if self._same(existing[0], existing, path, entry, size):
+                return existing[0], entry
+        return None, entry
+
+    def reserve(self, size, entry):
+        """Let lookup() match a file while it is probed, until add() or release() is called for it."""
+        self.reserved.setdefault(size, []).append(entry)
+
+    def release(self, size, entry):
+        """Drop a reserved file, it turned out not to be valid media."""
+        entries = self.reserved.get(size)
+        if entries is not None and entry in entries:
+            entries.remove(entry)
+            if not entries:
+                del self.reserved[size]
+
+    def add(self, size, entry):
+        self.release(size, entry)
+        path_id = self.paths.add(entry[0])
+        existing_entries = self.by_size.get(size)
+        if existing_entries is None and entry[1] is None:
+            self.by_size[size] = path_id
+            return
+        if existing_entries is None:
+            existing_entries = self.by_size[size] = []
+        elif isinstance(existing_entries, int):
+            existing_entries = self.by_size[size] = [[existing_entries, None, None]]
+        existing_entries.append([path_id, entry[1], entry[2]])
+
+    def _same(self, existing_path, existing, path, entry, size):
+        if self._partial_digest(existing_path, existing, size) is None:
+            return False
+        if self._partial_digest(path, entry, size) != existing[1]:
+            return False
+        return (self._full_digest(path, entry) is not None
+                and self._full_digest(existing_path, existing) == entry[2])
+
+    def _partial_digest(self, path, entry, size):
+        if entry[1] is None:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read(PARTIAL_HASH_BYTES)
+                    if size > 2 * PARTIAL_HASH_BYTES:
+                        f.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+                        data += f.read(PARTIAL_HASH_BYTES)
+                    elif size > PARTIAL_HASH_BYTES:
+                        data += f.read()
+                    self.bytes_read += len(data)
+                    entry[1] = hashlib.blake2b(data).digest()
+            except OSError:
+                return None
+            # Small files are covered completely by the partial hash
+            if size <= 2 * PARTIAL_HASH_BYTES:
+                entry[2] = entry[1]
+        return entry[1]
+
+    def _full_digest(self, path, entry):
+        if entry[2] is None:
+            try:
+                hasher = hashlib.blake2b()
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(FULL_HASH_CHUNK), b""):
+                        hasher.update(chunk)
+                        self.bytes_read += len(chunk)
+                entry[2] = hasher.digest()
+            except OSError:
+                return None
+        return entry[2]
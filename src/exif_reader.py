@@ -0,0 +1,170 @@
+import struct
+from datetime import datetime, timedelta, timezone
+
+# The EXIF block of a JPEG lives in APP1 right after the start of the file,
+# and is limited to 64KB by the segment length field
+HEAD_BYTES = 64 * 1024
+
+# EXIF tag ids
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_CREATE_DATE = 0x9004
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_OFFSET_TIME_DIGITIZED = 0x9012
+
+# TIFF field type for ASCII strings
+TYPE_ASCII = 2
+
+# Guard against corrupt files claiming huge directories
+MAX_IFD_ENTRIES = 1024
+
+
+def parse_exif_datetime(value, offset=None):
+    """Parse an EXIF date string (YYYY:MM:DD HH:MM:SS) into a datetime, or None.
+
+    If an EXIF offset string such as "+02:00" is given, the datetime is made
+    timezone aware.
+    """
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "ignore")
+    if not isinstance(value, str):
+        return None
+    try:
+        dt = datetime.strptime(value.strip("\x00 ")[:19], '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+
+    if isinstance(offset, bytes):
+        offset = offset.decode("ascii", "ignore")
+    if offset:
+        try:
+            sign = -1 if offset.startswith("-") else 1
+            hours, minutes = offset.strip("\x00 +-").split(":")[:2]
+            dt = dt.replace(tzinfo=timezone(sign * timedelta(hours=int(hours), minutes=int(minutes))))
+        except ValueError:
+            pass
+    return dt
+
+
+def read_exif_date(f):
+    """Read the capture date from the EXIF header of an open JPEG or TIFF file.
+
+    Only the first chunk of the file is read, plus a few small seeks if the
+    TIFF directories point past it. Returns DateTimeOriginal, falling back to
+    CreateDate, with the matching OffsetTime applied when present, or None if
+    the file has no usable EXIF date.
+    """
+    try:
+        source = _HeadReader(f)
+        tiff_start = _find_tiff_header(source)
+        if tiff_start is None:
+            return None
+        return _read_tiff_date(source, tiff_start)
+    except (struct.error, OSError, ValueError):
+        return None
+
+
+class _HeadReader:
+    """Random access reads that are served from the first chunk of a file when possible."""
+
+    def __init__(self, f):
+        self.f = f
+        self.base = f.tell()
+        self.head = f.read(HEAD_BYTES)
+
+    def read(self, offset, size):
+        if offset + size <= len(self.head):
+            return self.head[offset:offset + size]
+        self.f.seek(self.base + offset)
+        data = self.f.read(size)
+        if len(data) < size:
+            raise ValueError("unexpected end of file")
+        return data
+
+
+def _find_tiff_header(source):
+    """Return the offset of the TIFF header inside the file, or None."""
+    magic = source.head[:4]
+    if magic in (b"II*\x00", b"MM\x00*"):
+        return 0
+    if magic[:2] != b"\xff\xd8":
+        return None
+
+    # Walk the JPEG marker segments up to the start of the image data
+    pos = 2
+    while True:
+        marker = source.read(pos, 4)
+        if marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        if code in (0xD9, 0xDA):
+            # End of image or start of scan, no EXIF before the pixel data
+            return None
+        if code == 0x01 or 0xD0 <= code <= 0xD8:
+            # Markers without a length field
+            pos += 2
+            continue
+
+        length = struct.unpack(">H", marker[2:4])[0]
+        if code == 0xE1 and length >= 8 and source.read(pos + 4, 6) == b"Exif\x00\x00":
+            return pos + 10
+        pos += 2 + length
+
+
+def _read_tiff_date(source, tiff_start):
+    order = source.read(tiff_start, 2)
+    if order == b"II":
+        endian = "<"
+    elif order == b"MM":
+        endian = ">"
+    else:
+        return None
+
+    ifd0_offset = struct.unpack(endian + "I", source.read(tiff_start + 4, 4))[0]
+    ifd0 = _read_ifd(source, tiff_start, ifd0_offset, endian)
+    exif_pointer = ifd0.get(TAG_EXIF_IFD)
+    if exif_pointer is None:
+        return None
+
+    exif_offset = struct.unpack(endian + "I", exif_pointer[2])[0]
+    exif_ifd = _read_ifd(source, tiff_start, exif_offset, endian)
+
+    for date_tag, offset_tag in ((TAG_DATETIME_ORIGINAL, TAG_OFFSET_TIME_ORIGINAL),
+                                 (TAG_CREATE_DATE, TAG_OFFSET_TIME_DIGITIZED)):
+        value = _read_ascii(source, tiff_start, exif_ifd.get(date_tag), endian)
+        dt = parse_exif_datetime(value, _read_ascii(source, tiff_start, exif_ifd.get(offset_tag), endian))
+        if dt:
+            return dt
+    return None
+
+
+def _read_ifd(source, tiff_start, ifd_offset, endian):
+    """Return {tag: (type, count, raw 4-byte value field)} for one image file directory."""
+    base = tiff_start + ifd_offset
+    count = struct.unpack(endian + "H", source.read(base, 2))[0]
+    if count > MAX_IFD_ENTRIES:
+        raise ValueError("corrupt IFD")
+
+    data = source.read(base + 2, count * 12)
+    entries = {}
+    for i in range(count):
+        tag, field_type, value_count = struct.unpack(endian + "HHI", data[i * 12:i * 12 + 8])
+        entries[tag] = (field_type, value_count, data[i * 12 + 8:i * 12 + 12])
+    return entries
+
+
+def _read_ascii(source, tiff_start, entry, endian):
+    if entry is None:
+        return None
+    field_type, value_count, raw = entry
+    if field_type != TYPE_ASCII or value_count > 64:
+        return None
+    # Values up to 4 bytes are stored inline, longer ones at an offset
+    if value_count <= 4:
+        return raw[:value_count]
+    offset = struct.unpack(endian + "I", raw)[0]
+    return source.read(tiff_start + offset, value_count)
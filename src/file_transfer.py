@@ -0,0 +1,212 @@
+import os
+import sys
+import errno
+import shutil
+
+# Available ways to put a file into the organized tree
+TRANSFER_MODES = ("copy", "move", "hardlink", "reflink")
+
+# Copies are done in chunks of this size so a cancel takes effect mid-file
+COPY_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Suffix of copies in progress
+PARTIAL_SUFFIX = ".partial"
+
+# Linux ioctl to share the data blocks of two files (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+class TransferCanceled(Exception):
+    """Raised when a transfer is stopped because a cancel was requested."""
+
+
+def transfer_file(src, dst, mode="copy", cancel_check=None):
+    """Put src at dst using the given transfer mode and return the method actually used.
+
+    Modes that need support from the filesystem fall back automatically:
+    "move" copies and deletes across filesystems, and "hardlink" and
+    "reflink" fall back to a regular copy. A regular copy keeps timestamps
+    like shutil.copy2 and raises TransferCanceled between chunks when
+    cancel_check() returns True, removing the partial file. An existing dst
+    is never overwritten, FileExistsError is raised instead.
+    """
+    if mode == "move":
+        try:
+            # link + unlink is a rename that can't replace an existing file
+            os.link(src, dst)
+            os.remove(src)
+            return "move"
+        except FileExistsError:
+            raise
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                # No hard links on this filesystem (FAT, exFAT, ...), plain rename
+                if os.path.lexists(dst):
+                    raise FileExistsError(errno.EEXIST, "File exists", dst)
+                os.rename(src, dst)
+                return "move"
+        copy_file(src, dst, cancel_check)
+        os.remove(src)
+        return "copy+delete"
+
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except FileExistsError:
+            raise
+        except OSError:
+            pass
+
+    if mode == "reflink" and _reflink(src, dst):
+        return "reflink"
+
+    copy_file(src, dst, cancel_check)
+    return "copy"
+
+
+def copy_file(src, dst, cancel_check=None):
+    """Copy data and metadata from src to dst, in kernel where possible.
+
+    The data goes to a temporary file next to dst that only gets its final
+    name once it is complete, so dst either doesn't exist or is a full copy,
+    even if the process is killed mid-copy.
+    """
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, "File exists", dst)
+
+    partial = dst + PARTIAL_SUFFIX
+    with open(src, "rb") as fsrc:
+        # Overwrites the leftover of an interrupted copy
+        with open(partial, "wb") as fdst:
+            try:
+                size = os.fstat(fsrc.fileno()).st_size
+                copied = _copy_data(fsrc.fileno(), fdst.fileno(), size, cancel_check)
+                # A short copy is never published, a move would delete the rest of the data
+                if (copied != size or os.fstat(fdst.fileno()).st_size != size
+                        or os.fstat(fsrc.fileno()).st_size != size):
+                    raise OSError(errno.EIO, f"Copied {copied} of {size} bytes, the file changed while copying",
+                                  src)
+            except BaseException:
+                # Don't leave half-written files behind
+                fdst.close()
+                os.remove(partial)
+                raise
+    shutil.copystat(src, partial)
+    _publish(partial, dst)
+
+
+def _publish(partial, dst):
+    """Give a finished temporary file its final name without replacing an existing file."""
+    try:
+        os.link(partial, dst)
+    except FileExistsError:
+        os.remove(partial)
+        raise
+    except OSError:
+        # No hard links on this filesystem
+        if os.path.lexists(dst):
+            os.remove(partial)
+            raise FileExistsError(errno.EEXIST, "File exists", dst)
+        os.rename(partial, dst)
+        return
+    os.remove(partial)
+
+
+def _copy_data(src_fd, dst_fd, size, cancel_check):
+    """Copy up to size bytes and return how many were copied, fewer if the file shrank."""
+    offset = 0
+    # copy_file_range / sendfile keep the data in the kernel, and on some
+    # filesystems (NFS 4.2, btrfs, ...) copy_file_range is done server side
+    kernel_copy = None
+    if hasattr(os, "copy_file_range"):
+        kernel_copy = _copy_file_range
+    elif sys.platform.startswith("linux"):
+        kernel_copy = _sendfile_copy
+
+    while offset < size:
+        if cancel_check and cancel_check():
+            raise TransferCanceled()
+
+        count = min(COPY_CHUNK_SIZE, size - offset)
+        written = 0
+        if kernel_copy is not None:
+            try:
+                written = kernel_copy(src_fd, dst_fd, count, offset)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                                   errno.ENOTSUP, errno.EBADF):
+                    raise
+                # Not supported for this pair of files, use plain reads and writes from now on
+                kernel_copy = None
+                continue
+        else:
+            os.lseek(src_fd, offset, os.SEEK_SET)
+            data = os.read(src_fd, count)
+            written = len(data)
+            if written:
+                os.lseek(dst_fd, offset, os.SEEK_SET)
+                _write_all(dst_fd, data)
+
+        if written == 0:
+            if kernel_copy is not None:
+                # Some filesystems (FUSE, procfs, ...) copy nothing instead of failing, finish with reads and writes
+                kernel_copy = None
+                continue
+            # File shrank while copying
+            break
+        offset += written
+    return offset
+
+
+def _copy_file_range(src_fd, dst_fd, count, offset):
+    return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+
+
+def _sendfile_copy(src_fd, dst_fd, count, offset):
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _reflink(src, dst):
+    """Clone src to dst sharing data blocks, return False if the filesystem can't."""
+    if sys.platform.startswith("linux"):
+        import fcntl
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, "File exists", dst)
+        # Cloned under a temporary name like a copy, so a killed run never leaves an empty dst
+        partial = dst + PARTIAL_SUFFIX
+        with open(src, "rb") as fsrc, open(partial, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                cloned = True
+            except OSError:
+                cloned = False
+        if not cloned:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            return False
+        shutil.copystat(src, partial)
+        _publish(partial, dst)
+        return True
+
+    if sys.platform == "darwin":
+        import ctypes
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            clonefile = libc.clonefile
+        except (OSError, AttributeError):
+            return False
+        # clonefile creates dst in one step and also keeps the timestamps
+        return clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+
+    return False
@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import ctypes
+import hashlib
+import select
+import struct
+import ctypes.util
+
+from media_scanner import media_type_for_name, scan_media_files
+
+# A file is handed over once its size and modification time stayed the same this long
+SETTLE_SECONDS = 2.0
+
+# Seconds between directory scans when inotify can't be used
+POLL_INTERVAL = 5.0
+
+# Most files handed over at once, a large sync is organized in several batches
+MAX_BATCH = 1000
+
+# inotify(7) event bits and flags
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event without the name that follows it
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+def _wanted(name, include_photos, include_videos):
+    # Sync tools write hidden temporary files and rename them when done
+    return not name.startswith(".") and media_type_for_name(name, include_photos, include_videos) is not None
+
+
+class PendingFiles:
+    """Files that changed lately, handed over once they stop changing.
+
+    A file still being written or synced keeps changing its size or
+    modification time, so it is only ready when both stayed the same for
+    settle seconds. Files that disappear in the meantime are forgotten.
+    """
+
+    def __init__(self, settle=SETTLE_SECONDS):
+        self.settle = settle
+        # path -> ((size, mtime_ns) or None if not looked at yet, monotonic time it was last seen changing)
+        self.files = {}
+
+    def __len__(self):
+        return len(self.files)
+
+    def touch(self, path, signature=None):
+        """Note that path changed; signature is its (size, mtime_ns) if already known."""
+        self.files[path] = (signature, time.monotonic())
+
+    def ready(self, limit=MAX_BATCH):
+        """Return up to limit settled paths in sorted order, and forget them."""
+        now = time.monotonic()
+        ready = []
+        for path in sorted(self.files):
+            signature, since = self.files[path]
+            if now - since < self.settle:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.files[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != signature:
+                # Still changing, or not looked at before: wait another settle period
+                self.files[path] = (current, now)
+                continue
+            del self.files[path]
+            ready.append(path)
+            if len(ready) >= limit:
+                break
+        return ready
+
+
+class HandledFiles:
+    """Source files a watch session already transferred, by path, size and modification time.
+
+    Copied files stay in the source and may be reported again, for example
+    when they arrived during the first pass. A file edited in place after it
+    was organized has a different size or modification time and is handled
+    again. Each entry is a 64-bit digest, so a long session doesn't keep a
+    string per file.
+    """
+
+    def __init__(self):
+        self.keys = set()
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def _key(path, st):
+        digest = hashlib.blake2b(struct.pack("<Qq", st.st_size, st.st_mtime_ns), digest_size=8)
+        digest.update(os.fsencode(path))
+        return int.from_bytes(digest.digest(), "little")
+
+    def add(self, path):
+        """Note that path was transferred as it is now."""
+        try:
+            self.keys.add(self._key(path, os.stat(path)))
+        except OSError:
+            pass
+
+    def __contains__(self, path):
+        try:
+            return self._key(path, os.stat(path)) in self.keys
+        except OSError:
+            return False
+
+
+class InotifyWatcher:
+    """Report new media files under a directory tree through Linux inotify.
+
+    Every directory of the tree gets a watch, including ones created or
+    moved in later. If the kernel queue overflows and events are lost, the
+    whole tree is looked at once more.
+    """
+
+    def __init__(self, root, include_photos=True, include_videos=True, settle=SETTLE_SECONDS):
+        self.root = root
+        self.include_photos = include_photos
+        self.include_videos = include_videos
+        self.pending = PendingFiles(settle)
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # watch descriptor -> directory path
+        self.directories = {}
+        try:
+            self._watch_tree(root, touch=False)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, top, touch):
+        """Watch top and every directory below it; with touch, note the files already there."""
+        pending_dirs = [top]
+        while pending_dirs:
+            directory = pending_dirs.pop()
+            # Watch before listing, so files created in between are reported either way
+            wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                if directory == self.root and not touch:
+                    raise OSError(errno, os.strerror(errno), directory)
+                # Out of watches or gone again
+                print(f"Can't watch {directory}: {os.strerror(errno)}")
+                continue
+            self.directories[wd] = directory
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif touch and entry.is_file() and _wanted(entry.name, self.include_photos,
+                                                               self.include_videos):
+                        self.pending.touch(entry.path)
+                except OSError:
+                    continue
+
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, _READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self._watch_tree(self.root, touch=True)
+                continue
+            if mask & IN_IGNORED:
+                # The directory was deleted or moved away
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(path, touch=True)
+            elif _wanted(name, self.include_photos, self.include_videos):
+                signature = None
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    # Written completely or renamed into place, settling starts now
+                    try:
+                        st = os.stat(path)
+                        signature = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+                self.pending.touch(path, signature)
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for events and return the paths that are ready."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            self._read_events()
+        return self.pending.ready()
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """Report new and changed media files by scanning the tree every poll interval."""
+
+    def __init__(self, root, include_photos=True, include_videos=True, settle=SETTLE_SECONDS,
+                 poll_interval=POLL_INTERVAL):
+        self.root = root
+        self.include_photos = include_photos
+        self.include_videos = include_videos
+        self.pending = PendingFiles(settle)
+        self.poll_interval = poll_interval
+        # Files there when watching started are not reported
+        self.known = self._snapshot()
+        self.next_poll = time.monotonic() + poll_interval
+
+    def _snapshot(self):
+        snapshot = {}
+        for path, filename, _ in scan_media_files(self.root, self.include_photos, self.include_videos):
+            if not _wanted(filename, self.include_photos, self.include_videos):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for the next scan and return the paths that are ready."""
+        now = time.monotonic()
+        if now < self.next_poll:
+            time.sleep(min(timeout, self.next_poll - now))
+            now = time.monotonic()
+        if now >= self.next_poll:
+            snapshot = self._snapshot()
+            for path, signature in snapshot.items():
+                if self.known.get(path) != signature:
+                    self.pending.touch(path, signature)
+            self.known = snapshot
+            self.next_poll = time.monotonic() + self.poll_interval
+        return self.pending.ready()
+
+    def close(self):
+        self.known = {}
+
+
+def open_watcher(root, include_photos=True, include_videos=True, settle=SETTLE_SECONDS,
+                 poll_interval=POLL_INTERVAL, polling=False):
+    """Return an inotify watcher on Linux, or a polling one elsewhere or if polling is asked for.
+
+    Both have wait(timeout), returning a sorted list of settled paths, and close().
+    """
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root, include_photos, include_videos, settle)
+        except (OSError, AttributeError) as e:
+            # No inotify in this libc, or out of watches
+            print(f"Can't use inotify ({e}), scanning for new files every {poll_interval:g}s instead")
+    return PollingWatcher(root, include_photos, include_videos, settle, poll_interval)
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+
+# Index file kept inside the target directory
+LIBRARY_INDEX_FILENAME = ".library_index.sqlite3"
+
+# Rows are read back in blocks of this many
+LOAD_BATCH = 10000
+
+# Bump when the table layout or the fingerprint algorithm changes, the index is
+# then rebuilt by scanning the library. Cache fixes that don't touch what is
+# stored here leave it alone.
+LIBRARY_VERSION = 1
+
+
+class LibraryIndex:
+    """Persistent fingerprints of the files already organized into the target directory.
+
+    The index is built once by scanning the existing library and is then kept
+    up to date by adding every file a run puts into it, so later runs can
+    recognize files they already imported without looking at the library
+    again. Paths are stored relative to the library directory, so the
+    library can be moved or mounted elsewhere, and as os.fsencode() bytes
+    like in the cache.
+    """
+
+    def __init__(self, db_path, library_dir, batch_size=1000):
+        self.library_dir = os.path.abspath(library_dir)
+        self.batch_size = batch_size
+        self.pending_writes = []
+        self.pending_deletes = []
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != LIBRARY_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS library")
+            self.conn.execute("DROP TABLE IF EXISTS library_state")
+            self.conn.execute("PRAGMA user_version = %d" % LIBRARY_VERSION)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS library (
+                path BLOB PRIMARY KEY,
+                media_type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                fingerprint TEXT
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS library_state (built INTEGER NOT NULL)")
+        self.conn.commit()
+
+    @property
+    def is_built(self):
+        """True once the existing library has been scanned into the index."""
+        return self.conn.execute("SELECT built FROM library_state").fetchone() is not None
+
+    def mark_built(self):
+        self.flush()
+        with self.conn:
+            self.conn.execute("DELETE FROM library_state")
+            self.conn.execute("INSERT INTO library_state (built) VALUES (1)")
+
+    def _relative(self, path):
+        return os.fsencode(os.path.relpath(os.path.abspath(path), self.library_dir))
+
+    def stale_files(self, candidates):
+        """Yield the scan candidates that are missing from the index or changed since.
+
+        candidates are (path, filename, media_type) tuples from a scan of the
+        whole library. Files indexed without a fingerprint are yielded again.
+        Once the scan is exhausted, indexed files that are no longer there are
+        forgotten.
+        """
+        known = {path: (size, mtime_ns, fingerprint is not None) for path, size, mtime_ns, fingerprint
+                 in self.conn.execute("SELECT path, size, mtime_ns, fingerprint FROM library")}
+
+        for candidate in candidates:
+            relative = self._relative(candidate[0])
+            indexed = known.pop(relative, None)
+            try:
+                st = os.stat(candidate[0])
+            except OSError:
+                continue
+            if indexed != (st.st_size, st.st_mtime_ns, True):
+                yield candidate
+
+        self.pending_deletes.extend((path,) for path in known)
+        self.flush()
+
+    def add(self, path, media_type, fingerprint, st=None):
+        """Queue a library file for writing, stat-ing it if no os.stat result is given."""
+        if st is None:
+            st = os.stat(path)
+        self.pending_writes.append((self._relative(path), media_type, st.st_size,
+                                    st.st_mtime_ns, fingerprint))
+        if len(self.pending_writes) >= self.batch_size:
+            self.flush()
+
+    def iter_entries(self):
+        """Yield (path, media_type, size, fingerprint) for every indexed file, path being absolute."""
+        self.flush()
+        cursor = self.conn.execute("SELECT path, media_type, size, fingerprint FROM library")
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH)
+            if not rows:
+                return
+            for path, media_type, size, fingerprint in rows:
+                yield os.path.join(self.library_dir, os.fsdecode(path)), media_type, size, fingerprint
+
+    def flush(self):
+        """Write all queued changes in a single transaction."""
+        if not self.pending_writes and not self.pending_deletes:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO library (path, media_type, size, mtime_ns, fingerprint) "
+                "VALUES (?, ?, ?, ?, ?)",
+                self.pending_writes)
+            self.conn.executemany("DELETE FROM library WHERE path = ?", self.pending_deletes)
+        self.pending_writes = []
+        self.pending_deletes = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import time
+
+from media_probe import MediaInfo
+
+# Cache file kept inside the target directory
+CACHE_FILENAME = ".media_cache.sqlite3"
+
+# Bump when probe results change (e.g. a different fingerprint algorithm)
+# so entries written by older versions are discarded. Version 4 drops the
+# PNGs and other non-JPEG images wrongly cached as invalid without dedup,
+# version 5 stores paths as bytes, version 6 re-reads the JPEG/TIFF dates
+# the EXIF header reader missed, version 7 remembers whether a fingerprint
+# was asked for. The library index has its own version.
+CACHE_VERSION = 7
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_CHUNK = 500
+
+
+class MediaCache:
+    """Persistent probe results keyed by path, size, mtime and inode.
+
+    Lookups are done in bulk and writes are buffered and committed in batches.
+    Every entry that is read or written during a run is stamped with the run
+    id, so entries under a fully scanned source tree that were not seen again
+    can be evicted at the end. Paths are stored as os.fsencode() bytes, file
+    names that aren't valid UTF-8 can't be bound as SQLite text.
+    """
+
+    def __init__(self, db_path, batch_size=1000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.run_id = int(time.time() * 1000)
+        self.pending_writes = []
+        self.pending_touches = []
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS media")
+            self.conn.execute("PRAGMA user_version = %d" % CACHE_VERSION)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS media (
+                path BLOB PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                media_type TEXT NOT NULL,
+                valid INTEGER NOT NULL,
+                year TEXT NOT NULL,
+                month INTEGER NOT NULL,
+                fingerprint TEXT,
+                fingerprinted INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                error TEXT,
+                seen_run INTEGER NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def key_for(st):
+        """Return the (size, mtime_ns, inode) part of the cache key for an os.stat result."""
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def lookup_many(self, entries, need_fingerprint=True):
+        """Look up [(path, stat_result), ...] and return {path: MediaInfo} for the fresh hits."""
+        wanted = {path: self.key_for(st) for path, st in entries}
+        paths = list(wanted)
+        hits = {}
+
+        for start in range(0, len(paths), LOOKUP_CHUNK):
+            chunk = [os.fsencode(path) for path in paths[start:start + LOOKUP_CHUNK]]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                "SELECT path, size, mtime_ns, inode, media_type, valid, year, month, "
+                "fingerprint, fingerprinted, width, height, error FROM media WHERE path IN (%s)" % placeholders,
+                chunk)
+            for (raw_path, size, mtime_ns, inode, media_type, valid, year, month,
+                 fingerprint, fingerprinted, width, height, error) in rows:
+                path = os.fsdecode(raw_path)
+                # Stale entry, the file changed since it was cached
+                if (size, mtime_ns, inode) != wanted[path]:
+                    continue
+                # Probed without fingerprinting but we need one now. A video that
+                # can't be fingerprinted (no frame count, over its budget) is a hit.
+                if need_fingerprint and not fingerprinted:
+                    continue
+                year = int(year) if year.isdigit() else year
+                hits[path] = MediaInfo(path, media_type, bool(valid), year, month,
+                                       fingerprint, width, height, size, error)
+                self.pending_touches.append((self.run_id, raw_path))
+
+        if len(self.pending_touches) >= self.batch_size:
+            self.flush()
+        return hits
+
+    def put(self, info, st, fingerprinted=True):
+        """Queue a probe result for writing; fingerprinted tells if the probe was asked for a fingerprint."""
+        size, mtime_ns, inode = self.key_for(st)
+        self.pending_writes.append((
+            os.fsencode(info.path), size, mtime_ns, inode, info.media_type, int(info.valid), str(info.year),
+            info.month, info.fingerprint, int(fingerprinted), info.width, info.height, info.error, self.run_id))
+        if len(self.pending_writes) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all queued entries in a single transaction."""
+        if not self.pending_writes and not self.pending_touches:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO media (path, size, mtime_ns, inode, media_type, valid, year, "
+                "month, fingerprint, fingerprinted, width, height, error, seen_run) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self.pending_writes)
+            self.conn.executemany("UPDATE media SET seen_run = ? WHERE path = ?", self.pending_touches)
+        self.pending_writes = []
+        self.pending_touches = []
+
+    def evict_unseen(self, source_dir):
+        """Delete entries under source_dir that were not seen during this run."""
+        self.flush()
+        prefix = os.fsencode(os.path.join(os.path.abspath(source_dir), ""))
+        # Every path starting with prefix sorts between prefix and prefix with
+        # its last byte (the separator) incremented
+        end = prefix[:-1] + bytes([prefix[-1] + 1])
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM media WHERE path >= ? AND path < ? AND seen_run != ?",
+                (prefix, end, self.run_id))
+        return cursor.rowcount
+
+    def close(self):
+        self.flush()
+        self.conn.close()
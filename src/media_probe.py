@@ -0,0 +1,452 @@
+import os
+import time
+from collections import deque, namedtuple
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+
+import cv2
+import imagehash
+import numpy as np
+from PIL import Image
+
+from exif_reader import TAG_DATETIME_ORIGINAL, TAG_EXIF_IFD, parse_exif_datetime, read_exif_date
+from video_metadata import read_video_creation_date
+
+# phash works on a 32x32 grayscale image (8x8 hash, highfreq_factor 4)
+PHASH_INPUT_SIZE = 32
+
+# Where in a video (fraction of its length) frames are sampled for the fingerprint
+VIDEO_SAMPLE_POINTS = [0.1, 0.3, 0.5, 0.7, 0.9]
+
+# Gaps up to this many frames are walked with grab(), longer ones are seeked
+VIDEO_MAX_SEQUENTIAL_GRABS = 120
+
+# Per-file limits for video fingerprinting so one bad file can't stall a run
+VIDEO_TIME_BUDGET = 10.0
+VIDEO_FRAME_BUDGET = 2000
+
+# How many candidates are looked up in the cache at once
+CACHE_LOOKUP_BATCH = 256
+
+# Everything the rest of the pipeline needs to know about one media file
+MediaInfo = namedtuple("MediaInfo", [
+    "path",         # source file path
+    "media_type",   # "image" or "video"
+    "valid",        # False if the file could not be opened as media
+    "year",         # capture year, or "Unknown"
+    "month",        # capture month (1-12), 0 if unknown
+    "fingerprint",  # perceptual hash / frame digest, None if not computed or failed
+    "width",
+    "height",
+    "size",         # file size in bytes
+    "error",        # error message if anything went wrong, else None
+    "duplicate_of", # path of a byte-identical file seen earlier, the file was not probed
+], defaults=[None])
+
+
+class _ProbingOriginal:
+    """A file whose probe is in flight, which byte-identical files found meanwhile wait for."""
+
+    __slots__ = ("entry", "valid")
+
+    def __init__(self, entry):
+        self.entry = entry      # ExactDuplicateIndex entry, reserved until the probe is done
+        self.valid = None       # whether it turned out to be valid media, None while probing
+
+
+# A byte-identical copy of a _ProbingOriginal, waiting for the original's probe
+_WaitingCopy = namedtuple("_WaitingCopy", [
+    "path",
+    "media_type",
+    "original",     # the _ProbingOriginal
+    "probe",        # probes the copy itself, if the original turns out not to be valid media
+])
+
+
+def date_from_mtime(mtime):
+    """Turn a modification timestamp into (year, month)."""
+    try:
+        dt = datetime.fromtimestamp(mtime)
+        return dt.year, dt.month
+    except (OverflowError, OSError, ValueError):
+        return "Unknown", 0
+
+
+def probe_media(file_path, media_type, compute_fingerprint=True, st=None,
+                video_time_budget=VIDEO_TIME_BUDGET, video_frame_budget=VIDEO_FRAME_BUDGET, timings=None):
+    """Open a media file once and collect validity, capture date, fingerprint and dimensions.
+
+    Video fingerprinting stops after video_time_budget seconds or
+    video_frame_budget decoded frames, whichever comes first. If a timings
+    dict is given, the seconds spent in each step are added to it, and
+    counters under keys starting with "#".
+    """
+    try:
+        if st is None:
+            st = os.stat(file_path)
+    except OSError as e:
+        return MediaInfo(file_path, media_type, False, "Unknown", 0, None, 0, 0, 0, str(e))
+
+    if media_type == "video":
+        return _probe_video(file_path, st, compute_fingerprint, video_time_budget, video_frame_budget, timings)
+    return _probe_image(file_path, st, compute_fingerprint, timings)
+
+
+def iter_probed_media(candidates, compute_fingerprint=True, workers=1, max_pending=None, cache=None,
+                      exact_index=None, video_time_budget=VIDEO_TIME_BUDGET,
+                      video_frame_budget=VIDEO_FRAME_BUDGET, profiler=None):
+    """Probe (file_path, filename, media_type) candidates and yield (filename, MediaInfo) in input order.
+
+    With workers > 1 the probing runs in a process pool. At most max_pending
+    files are in flight at once, so the scanner never runs far ahead of the
+    consumer and results come back in the same deterministic order as the scan.
+    If a MediaCache is given, candidates are looked up in bulk first and only
+    the misses are probed; fresh results are written back to the cache.
+    If an ExactDuplicateIndex is given, byte-identical copies of files that
+    were yielded earlier as valid media are reported through duplicate_of
+    without being probed at all. Copies of a file still being probed wait
+    for its result, so the outcome doesn't depend on the number of workers. If a StageProfiler is given, the probe
+    steps, cache lookups and exact-copy checks are measured.
+    """
+    if max_pending is None:
+        max_pending = workers * 4 if workers > 1 else 1
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    probe = _probe_timed if profiler else probe_media
+
+    # (filename, stat_result or None, MediaInfo or Future or _WaitingCopy, came_from_cache,
+    #  _ProbingOriginal or None)
+    pending = deque()
+    # path -> _ProbingOriginal of the files in pending that copies can match
+    probing = {}
+    try:
+        batch_size = CACHE_LOOKUP_BATCH if cache else 1
+        for batch in _batched(candidates, batch_size):
+            if profiler:
+                started = time.perf_counter()
+            stats, hits = _lookup_batch(batch, cache, compute_fingerprint, exact_index is not None)
+            if profiler:
+                profiler.add("cache_lookup", time.perf_counter() - started)
+                profiler.count("cache_hits", len(hits))
+
+            for file_path, filename, media_type in batch:
+                st = stats.get(file_path)
+                original_record = None
+                if exact_index is not None and st is not None:
+                    if profiler:
+                        started = time.perf_counter()
+                        bytes_read = exact_index.bytes_read
+                    original, exact_entry = exact_index.lookup(file_path, st.st_size)
+                    if profiler:
+                        profiler.add("exact_lookup", time.perf_counter() - started,
+                                     exact_index.bytes_read - bytes_read, file_path)
+                    if original is not None and original in probing:
+                        # Decided once the probe of the original is done
+                        copy = _WaitingCopy(file_path, media_type, probing[original],
+                                            partial(probe, file_path, media_type, compute_fingerprint, st,
+                                                    video_time_budget, video_frame_budget))
+                        pending.append((filename, st, copy, False, None))
+                        continue
+                    if original is not None:
+                        info = MediaInfo(file_path, media_type, True, "Unknown", 0, None, 0, 0,
+                                         st.st_size, None, original)
+                        pending.append((filename, None, info, False, None))
+                        continue
+                    exact_index.reserve(st.st_size, exact_entry)
+                    original_record = probing[file_path] = _ProbingOriginal(exact_entry)
+
+                if file_path in hits:
+                    pending.append((filename, st, hits[file_path], True, original_record))
+                elif executor:
+                    future = executor.submit(probe, file_path, media_type, compute_fingerprint, st,
+                                             video_time_budget, video_frame_budget)
+                    pending.append((filename, st, future, False, original_record))
+                else:
+                    info = probe(file_path, media_type, compute_fingerprint, st,
+                                 video_time_budget, video_frame_budget)
+                    pending.append((filename, st, info, False, original_record))
+
+                # Wait for the oldest result once the window is full
+                while len(pending) >= max_pending:
+                    yield _finish_probe(pending.popleft(), compute_fingerprint, cache, exact_index,
+                                        probing, profiler)
+
+        while pending:
+            yield _finish_probe(pending.popleft(), compute_fingerprint, cache, exact_index, probing, profiler)
+    finally:
+        # Drop queued work if the consumer stopped early (e.g. cancel)
+        for _, _, result, _, _ in pending:
+            if isinstance(result, Future):
+                result.cancel()
+        if executor:
+            executor.shutdown(wait=True)
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _lookup_batch(batch, cache, compute_fingerprint, need_stats=False):
+    """Stat a batch of candidates and fetch their cached probe results."""
+    if cache is None and not need_stats:
+        return {}, {}
+
+    stats = {}
+    for file_path, _, _ in batch:
+        try:
+            stats[file_path] = os.stat(file_path)
+        except OSError:
+            # Let the probe report the error, nothing to cache
+            pass
+    if cache is None:
+        return stats, {}
+    return stats, cache.lookup_many(stats.items(), compute_fingerprint)
+
+
+def _finish_probe(item, compute_fingerprint, cache, exact_index, probing, profiler=None):
+    filename, st, result, from_cache, original_record = item
+    waiting_copy = isinstance(result, _WaitingCopy)
+    if waiting_copy:
+        # The original was probed before this copy, it is done by now
+        if result.original.valid:
+            return filename, MediaInfo(result.path, result.media_type, True, "Unknown", 0, None, 0, 0,
+                                       st.st_size, None, result.original.entry[0])
+        # Not valid media, which a copy normally isn't either: look at the copy itself
+        result = result.probe()
+    elif isinstance(result, Future):
+        if profiler:
+            started = time.perf_counter()
+            result = result.result()
+            # Time the coordinator sat waiting for the pool
+            profiler.add("probe_wait", time.perf_counter() - started)
+        else:
+            result = result.result()
+    if isinstance(result, tuple) and not isinstance(result, MediaInfo):
+        # Probed with timings
+        info, timings = result
+        profiler.add("probe_" + info.media_type, timings.pop("probe"), info.size or 0, info.path)
+        profiler.add_timings(timings, info.path)
+    else:
+        info = result
+    if cache is not None and st is not None and not from_cache:
+        cache.put(info, st, compute_fingerprint)
+    valid = info.valid and info.error is None
+    # Later byte-identical copies can now match this file
+    if original_record is not None:
+        del probing[original_record.entry[0]]
+        original_record.valid = valid
+        if valid:
+            exact_index.add(st.st_size, original_record.entry)
+        else:
+            exact_index.release(st.st_size, original_record.entry)
+    elif waiting_copy and valid:
+        exact_index.add(st.st_size, [info.path, None, None])
+    return filename, info
+
+
+def _probe_timed(file_path, media_type, *args):
+    """probe_media that also returns the timings of its steps, as (info, timings)."""
+    timings = {}
+    started = time.perf_counter()
+    info = probe_media(file_path, media_type, *args, timings=timings)
+    timings["probe"] = time.perf_counter() - started
+    return info, timings
+
+
+def _lap(timings, step, started):
+    """Add the time since started to a step and return the current time."""
+    now = time.perf_counter()
+    timings[step] = timings.get(step, 0.0) + now - started
+    return now
+
+
+def _init_worker():
+    # One OpenCV thread per worker process, the pool already uses every core
+    cv2.setNumThreads(1)
+
+
+def _probe_image(file_path, st, compute_fingerprint, timings=None):
+    year, month = date_from_mtime(st.st_mtime)
+    fingerprint = None
+    error = None
+    if timings is not None:
+        started = time.perf_counter()
+    try:
+        with open(file_path, "rb") as f:
+            # Capture date straight from the EXIF header, a small read for JPEG/TIFF
+            dt = read_exif_date(f)
+            f.seek(0)
+            if timings is not None:
+                started = _lap(timings, "image_exif", started)
+
+            with Image.open(f) as img:
+                width, height = img.size
+
+                if not compute_fingerprint:
+                    # No decode needed, just check the file structure. verify() has to
+                    # come straight after open, reading PNG EXIF already loads the image.
+                    img.verify()
+                    if timings is not None:
+                        started = _lap(timings, "image_verify", started)
+
+                # Other formats (PNG, WebP, ...), and EXIF blocks the header reader
+                # can't make sense of, go through PIL's EXIF support
+                if dt is None:
+                    if compute_fingerprint:
+                        dt = _pil_exif_date(img)
+                    else:
+                        # A verified image can't be used any more
+                        f.seek(0)
+                        with Image.open(f) as exif_img:
+                            dt = _pil_exif_date(exif_img)
+                if dt:
+                    year, month = dt.year, dt.month
+                if timings is not None:
+                    started = _lap(timings, "image_open", started)
+
+                if compute_fingerprint:
+                    # Decoding the pixels for the hash doubles as validation
+                    try:
+                        fingerprint = str(imagehash.phash(_hash_input(img)))
+                    except Exception as e:
+                        error = str(e)
+                    if timings is not None:
+                        _lap(timings, "image_decode_hash", started)
+                        timings["#image_decodes"] = 1
+    except Exception as e:
+        return MediaInfo(file_path, "image", False, year, month, None, 0, 0, st.st_size, str(e))
+
+    return MediaInfo(file_path, "image", True, year, month, fingerprint, width, height, st.st_size, error)
+
+
+def _pil_exif_date(img):
+    exif = img.getexif()
+    return parse_exif_datetime(exif.get_ifd(TAG_EXIF_IFD).get(TAG_DATETIME_ORIGINAL))
+
+
+def _hash_input(img):
+    """Return a small grayscale version of an image, enough for phash.
+
+    JPEGs are decoded straight from the DCT coefficients at 1/2, 1/4 or 1/8
+    scale in grayscale, so a 48MP photo never gets decoded at full size. We
+    keep at least twice the phash input size so the final antialiased resize
+    still has detail to work with and small images hash as before.
+    Other formats are converted to grayscale only, which still saves the
+    full-size RGB copy; phash does the final resize itself.
+    """
+    if img.format == "JPEG":
+        img.draft("L", (PHASH_INPUT_SIZE * 2, PHASH_INPUT_SIZE * 2))
+    return img.convert("L")
+
+
+def _probe_video(file_path, st, compute_fingerprint, time_budget, frame_budget, timings=None):
+    if timings is not None:
+        started = time.perf_counter()
+    # Creation time from the MP4/MOV or Matroska container, else the modification time
+    created = read_video_creation_date(file_path)
+    if timings is not None:
+        started = _lap(timings, "video_container_date", started)
+    if created:
+        local = created.astimezone()
+        year, month = local.year, local.month
+    else:
+        year, month = date_from_mtime(st.st_mtime)
+
+    # A parsed container header is proof enough when no frames are needed
+    if created and not compute_fingerprint:
+        return MediaInfo(file_path, "video", True, year, month, None, 0, 0, st.st_size, None)
+
+    cap = cv2.VideoCapture(file_path)
+    if timings is not None:
+        started = _lap(timings, "video_open", started)
+    try:
+        if not cap.isOpened():
+            return MediaInfo(file_path, "video", False, year, month, None, 0, 0, st.st_size,
+                             "could not open video")
+
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fingerprint = None
+        if compute_fingerprint:
+            fingerprint = _video_fingerprint(cap, time_budget, frame_budget, timings)
+            if timings is not None:
+                _lap(timings, "video_fingerprint", started)
+        return MediaInfo(file_path, "video", True, year, month, fingerprint, width, height, st.st_size, None)
+    except Exception as e:
+        return MediaInfo(file_path, "video", True, year, month, None, 0, 0, st.st_size, str(e))
+    finally:
+        cap.release()
+
+
+def _video_fingerprint(cap, time_budget, frame_budget, timings=None):
+    """Perceptual hash of frames sampled across the video, hex hashes joined by "-".
+
+    Nearby samples are reached with grab(), which skips the color conversion
+    of the frames in between, and distant ones with a seek. Each sampled frame
+    is shrunk to 32x32 right away and hashed like imagehash.phash does, so two
+    encodes of the same clip end up a few bits apart per frame. If the time
+    or frame budget runs out before every sample is taken, None is returned:
+    a shorter fingerprint would depend on the load of the machine and never
+    match the full one of the same video.
+    """
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if total_frames <= 0:
+        return None
+
+    deadline = time.monotonic() + time_budget
+    targets = sorted(set(min(int(total_frames * point), total_frames - 1)
+                         for point in VIDEO_SAMPLE_POINTS))
+    frame_hashes = []
+    position = 0
+    decoded = 0
+    out_of_budget = False
+
+    for target in targets:
+        if target - position > VIDEO_MAX_SEQUENTIAL_GRABS:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            position = target
+        while position < target and decoded < frame_budget and time.monotonic() < deadline:
+            if not cap.grab():
+                break
+            position += 1
+            decoded += 1
+        if decoded >= frame_budget or time.monotonic() >= deadline:
+            out_of_budget = True
+            break
+        if position < target:
+            # The video is shorter than its frame count
+            break
+
+        ret, frame = cap.read()
+        position += 1
+        decoded += 1
+        if ret:
+            frame_hashes.append(_frame_phash(frame))
+
+    if timings is not None:
+        timings["#video_frames_decoded"] = decoded
+    if out_of_budget or not frame_hashes:
+        return None
+    return "-".join("%016x" % frame_hash for frame_hash in frame_hashes)
+
+
+def _frame_phash(frame):
+    """64-bit perceptual hash of a BGR frame (DCT of a 32x32 grayscale thumbnail)."""
+    small = cv2.resize(frame, (PHASH_INPUT_SIZE, PHASH_INPUT_SIZE), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    low_freq = cv2.dct(gray)[:8, :8]
+    bits = (low_freq > np.median(low_freq)).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
@@ -0,0 +1,78 @@
+import os
+import threading
+
+# Extensions we consider candidate media files
+IMAGE_EXTENSIONS = frozenset(['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'])
+VIDEO_EXTENSIONS = frozenset(['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v', '.3gp'])
+
+
+def media_type_for_name(filename, include_photos=True, include_videos=True):
+    """Return "image", "video" or None based on the file extension only."""
+    file_ext = os.path.splitext(filename)[1].lower()
+    if include_photos and file_ext in IMAGE_EXTENSIONS:
+        return "image"
+    if include_videos and file_ext in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+def scan_media_files(source_dir, include_photos=True, include_videos=True, cancel_check=None,
+                     skip_dirs=()):
+    """Yield (file_path, filename, media_type) for every candidate media file under source_dir.
+
+    Uses os.scandir so directory entries are classified without extra stat calls,
+    and never opens the files themselves. Entries are visited in sorted order so
+    repeated scans of the same tree produce the same sequence. Directories whose
+    path is in skip_dirs are not entered.
+    """
+    skip_dirs = set(os.path.normpath(path) for path in skip_dirs)
+    pending_dirs = [source_dir]
+    while pending_dirs:
+        if cancel_check and cancel_check():
+            return
+
+        current_dir = pending_dirs.pop()
+        try:
+            with os.scandir(current_dir) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            # Unreadable directory, skip it like os.walk does
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.normpath(entry.path) not in skip_dirs:
+                        subdirs.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            media_type = media_type_for_name(entry.name, include_photos, include_videos)
+            if media_type:
+                yield entry.path, entry.name, media_type
+
+        # Push subdirectories in reverse so they are popped in sorted order
+        pending_dirs.extend(reversed(subdirs))
+
+
+class MediaFileCounter(threading.Thread):
+    """Count candidate media files in the background while processing has already started."""
+
+    def __init__(self, source_dir, include_photos=True, include_videos=True, cancel_check=None):
+        super().__init__(daemon=True)
+        self.source_dir = source_dir
+        self.include_photos = include_photos
+        self.include_videos = include_videos
+        self.cancel_check = cancel_check
+        self.count = 0
+        self.done = False
+
+    def run(self):
+        for _ in scan_media_files(self.source_dir, self.include_photos,
+                                  self.include_videos, self.cancel_check):
+            self.count += 1
+        self.done = True
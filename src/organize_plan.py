@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+from collections import namedtuple
+
+from file_transfer import transfer_file
+
+# Plan file written into the target directory
+PLAN_FILENAME = "organize_plan.jsonl"
+
+# What to do with a source file
+ACTION_ORGANIZE = "organize"
+ACTION_DUPLICATE = "duplicate"
+
+# One decision of the planning phase
+PlanEntry = namedtuple("PlanEntry", [
+    "action",        # ACTION_ORGANIZE or ACTION_DUPLICATE
+    "source",        # source file path
+    "target",        # destination path, decided at planning time
+    "media_type",    # "image" or "video"
+    "duplicate_of",  # path of the file this one duplicates, else None
+    "fingerprint",   # fingerprint of the source, None if not computed
+    "size",          # source file size in bytes
+], defaults=[None, None])
+
+
+class TargetNamer:
+    """Pick collision-free target paths in memory.
+
+    Each target directory is listed at most once, the first time a file is
+    planned into it, and every planned name is remembered, so no per-file
+    existence checks hit the disk. Names are compared case-insensitively so
+    plans are also safe on case-insensitive filesystems. Renames only depend
+    on the source path and the order of planning, so the same source tree
+    always produces the same names.
+    """
+
+    def __init__(self):
+        # directory -> set of lowercased names that exist or are planned
+        self.names = {}
+
+    def _names_in(self, directory):
+        names = self.names.get(directory)
+        if names is None:
+            try:
+                names = set(name.lower() for name in os.listdir(directory))
+            except OSError:
+                names = set()
+            self.names[directory] = names
+        return names
+
+    def reserve(self, target_path):
+        """Mark a target path as taken, e.g. by a plan entry of an earlier run."""
+        self._names_in(os.path.dirname(target_path)).add(os.path.basename(target_path).lower())
+
+    def organized_path(self, directory, filename, source_path):
+        """Target path for an organized file, renamed with a stable source digest on collision."""
+        names = self._names_in(directory)
+        if filename.lower() in names:
+            base, ext = os.path.splitext(filename)
+            digest = hashlib.sha1(os.fsencode(source_path)).hexdigest()[:8]
+            candidate = f"{base}_{digest}{ext}"
+            counter = 1
+            while candidate.lower() in names:
+                candidate = f"{base}_{digest}_{counter}{ext}"
+                counter += 1
+            filename = candidate
+        names.add(filename.lower())
+        return os.path.join(directory, filename)
+
+    def duplicate_path(self, directory, filename):
+        """Target path in the duplicates folder, numbered on collision."""
+        names = self._names_in(directory)
+        if filename.lower() in names:
+            base, ext = os.path.splitext(filename)
+            counter = 1
+            while f"{base}_dup_{counter}{ext}".lower() in names:
+                counter += 1
+            filename = f"{base}_dup_{counter}{ext}"
+        names.add(filename.lower())
+        return os.path.join(directory, filename)
+
+
+class PlanWriter:
+    """Stream plan entries to a JSON Lines file and collect the directories they need."""
+
+    def __init__(self, plan_path):
+        self.plan_path = plan_path
+        self.directories = set()
+        self.count = 0
+        # Total size of the planned files
+        self.bytes = 0
+        self.file = open(plan_path, "w", encoding="utf-8")
+
+    def add(self, entry):
+        self.directories.add(os.path.dirname(entry.target))
+        self.file.write(json.dumps(entry._asdict()) + "\n")
+        self.count += 1
+        self.bytes += entry.size or 0
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_plan(plan_path):
+    """Yield the PlanEntry records of a plan file."""
+    with open(plan_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield PlanEntry(**json.loads(line))
+
+
+def iter_apply_plan(entries, transfer_mode="copy", cancel_check=None, directories=None,
+                    resumed_sources=None):
+    """Execute plan entries and yield (entry, error) for each one, error being None on success.
+
+    All directories are created up front when they are known (they are
+    collected while the plan is written), otherwise once each the first time
+    they show up. Transfers never overwrite an existing file, so a stale plan
+    reports errors instead of clobbering anything. Entries whose source is in
+    resumed_sources were planned by an interrupted run; if their target
+    already exists the transfer finished before the interruption.
+    """
+    created = set()
+    for directory in sorted(directories or ()):
+        os.makedirs(directory, exist_ok=True)
+        created.add(directory)
+
+    for entry in entries:
+        directory = os.path.dirname(entry.target)
+        try:
+            if directory not in created:
+                os.makedirs(directory, exist_ok=True)
+                created.add(directory)
+            if resumed_sources and entry.source in resumed_sources and os.path.lexists(entry.target):
+                _finish_interrupted(entry, transfer_mode)
+            else:
+                transfer_file(entry.source, entry.target, transfer_mode, cancel_check)
+        except OSError as e:
+            yield entry, e
+            continue
+        yield entry, None
+
+
+def _finish_interrupted(entry, transfer_mode):
+    """Complete a transfer that was interrupted after its target was created."""
+    # A move is a link followed by an unlink, the unlink may be missing
+    if transfer_mode == "move" and os.path.exists(entry.source):
+        if os.path.samefile(entry.source, entry.target):
+            os.remove(entry.source)
@@ -0,0 +1,850 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import traceback
+from collections import namedtuple
+
+from duplicate_index import DuplicateIndex, ExactDuplicateIndex, PathTable
+from file_transfer import TRANSFER_MODES, TransferCanceled
+from folder_watcher import POLL_INTERVAL, SETTLE_SECONDS, HandledFiles, open_watcher
+from library_index import LIBRARY_INDEX_FILENAME, LibraryIndex
+from media_cache import CACHE_FILENAME, MediaCache
+from media_probe import VIDEO_FRAME_BUDGET, VIDEO_TIME_BUDGET, iter_probed_media
+from media_scanner import MediaFileCounter, media_type_for_name, scan_media_files
+from organize_plan import (ACTION_DUPLICATE, ACTION_ORGANIZE, PLAN_FILENAME, PlanEntry, PlanWriter,
+                           TargetNamer, iter_apply_plan, read_plan)
+from progress_channel import ProgressChannel, ThroughputMeter, describe
+from run_profiler import PROFILE_FILENAME, StageProfiler
+from run_journal import JOURNAL_FILENAME, RunJournal, replay_journal
+from shard_plan import (SHARD_MODES, ShardWriter, iter_merged_shards, open_shards, relative_source_path,
+                        shard_cache_path, shard_filename, shard_of)
+
+# Month names for folder organization
+MONTH_NAMES = {
+    1: "01-January", 2: "02-February", 3: "03-March", 4: "04-April",
+    5: "05-May", 6: "06-June", 7: "07-July", 8: "08-August",
+    9: "09-September", 10: "10-October", 11: "11-November", 12: "12-December",
+    0: "00-Unknown"  # For cases where month can't be determined
+}
+
+# Seconds between progress lines of the command line
+CLI_PROGRESS_INTERVAL = 1.0
+
+# Seconds a watch session waits for new files before looking for a cancel
+WATCH_WAIT = 0.5
+
+# Everything a run can be configured with
+OrganizeOptions = namedtuple("OrganizeOptions", [
+    "source_dir",
+    "target_dir",
+    "include_photos",
+    "include_videos",
+    "organize_by_year",
+    "organize_by_month",
+    "find_duplicates",
+    "similarity_threshold",  # differing bits still counted as a duplicate, 0 = identical
+    "video_time_budget",     # seconds allowed for fingerprinting a single video
+    "video_frame_budget",    # frames decoded at most for fingerprinting a single video
+    "transfer_mode",         # one of TRANSFER_MODES
+    "dry_run",               # only write the plan
+    "use_cache",             # reuse probe results of earlier runs
+    "check_library",         # also find duplicates of files already in the target directory
+    "rescan_library",        # re-index the target directory for changes made by hand
+    "workers",               # processes used for probing
+    "profile_path",          # JSON file for per-stage timings, None to not profile
+], defaults=[True, True, True, True, True, 0, VIDEO_TIME_BUDGET, VIDEO_FRAME_BUDGET, "copy", False, True, True, False,
+             1, None])
+
+
+def check_options(options):
+    """Raise ValueError with a message for the user if the options can't be used for a run."""
+    if not options.source_dir or not os.path.isdir(options.source_dir):
+        raise ValueError("Please select a valid source directory.")
+    if not options.target_dir:
+        raise ValueError("Please select a target directory.")
+    if not options.include_photos and not options.include_videos:
+        raise ValueError("Please select at least one file type to process.")
+    if not options.organize_by_year and not options.organize_by_month:
+        raise ValueError("Please select at least one organization method.")
+    if options.transfer_mode not in TRANSFER_MODES:
+        raise ValueError(f"Unknown transfer mode: {options.transfer_mode}")
+
+
+def check_watch_options(options):
+    """Raise ValueError if the options can't be used for watching the source directory."""
+    if options.dry_run:
+        raise ValueError("A dry run can't keep watching for new files.")
+    source_dir = os.path.abspath(options.source_dir)
+    if os.path.commonpath([source_dir, os.path.abspath(options.target_dir)]) == source_dir:
+        # Organized files would show up as new arrivals
+        raise ValueError("The target directory can't be inside the watched source directory.")
+
+
+def new_stats():
+    return {
+        "total_files": 0,
+        "organized_photos": 0,
+        "organized_videos": 0,
+        "duplicates": 0,
+        "errors": 0
+    }
+
+
+class MediaOrganizer:
+    """Scan, probe, deduplicate and organize media files without any UI.
+
+    run() does the work on the calling thread and publishes its progress to
+    the events channel, which another thread can drain. watch() does the
+    same and then keeps organizing files as they arrive. A sharded run
+    splits the work over nodes with build_shard() and then organizes
+    everything with merge_shards(). cancel() may be called from any thread.
+    """
+
+    def __init__(self, options, events=None):
+        self.options = options
+        self.events = events if events is not None else ProgressChannel()
+        self.stats = new_stats()
+        # Per-stage timings, only kept when a profile is asked for
+        self.profiler = StageProfiler(options.profile_path) if options.profile_path else None
+        self.cancel_requested = False
+        # Set once a run got to the end without being canceled
+        self.completed = False
+        # Opened for a run or a watch session and closed at its end
+        self.cache = None
+        self.library = None
+        self.journal = None
+
+    def cancel(self):
+        """Ask a running run() to stop as soon as possible."""
+        self.cancel_requested = True
+
+    def target_directory(self, year, month, media_type):
+        """Return the target directory path based on organization options."""
+        options = self.options
+        target_dir = options.target_dir
+
+        # Organize by year if enabled
+        if options.organize_by_year:
+            target_dir = os.path.join(target_dir, str(year))
+
+        # Organize by month if enabled
+        if options.organize_by_month and month > 0:
+            month_name = MONTH_NAMES.get(month, "00-Unknown")
+            target_dir = os.path.join(target_dir, month_name)
+
+        # Create media type subdirectory
+        if media_type == "video":
+            target_dir = os.path.join(target_dir, "Videos")
+        else:
+            target_dir = os.path.join(target_dir, "Photos")
+
+        return target_dir
+
+    def load_library(self, photo_index, video_index, exact_index, duplicates_dir, cancel_check):
+        """Open the target library index, building or refreshing it if needed, and load it into the duplicate indexes."""
+        options = self.options
+        library = LibraryIndex(os.path.join(options.target_dir, LIBRARY_INDEX_FILENAME), options.target_dir)
+
+        # The first run over a library, or a requested rescan, probes the files
+        # that are new or changed since they were indexed
+        if not library.is_built or options.rescan_library:
+            self.events.publish("indexing", force=True)
+            candidates = scan_media_files(options.target_dir, cancel_check=cancel_check, skip_dirs=[duplicates_dir])
+            stale = library.stale_files(candidates)
+            indexed = 0
+            for _, info in iter_probed_media(stale, True, workers=options.workers,
+                                             video_time_budget=options.video_time_budget,
+                                             video_frame_budget=options.video_frame_budget,
+                                             profiler=self.profiler):
+                if self.cancel_requested:
+                    return library
+                if info.valid and info.error is None:
+                    library.add(info.path, info.media_type, info.fingerprint)
+                indexed += 1
+                self.events.publish("indexing", indexed)
+            library.mark_built()
+
+        self.events.publish("loading", force=True)
+        if self.profiler:
+            started = time.perf_counter()
+        for path, media_type, size, fingerprint in library.iter_entries():
+            if exact_index is not None:
+                exact_index.add(size, [path, None, None])
+            if fingerprint:
+                hash_index = video_index if media_type == "video" else photo_index
+                hash_index.add(fingerprint, path)
+        if self.profiler:
+            self.profiler.add("library_load", time.perf_counter() - started)
+        return library
+
+    def _is_canceled(self):
+        return self.cancel_requested
+
+    def _open(self, probing=True):
+        """Set up the duplicate state, cache and library kept for every batch of a session.
+
+        Without probing the files are never looked at, so there is no cache.
+        """
+        options = self.options
+        os.makedirs(options.target_dir, exist_ok=True)
+        self.source_dir = os.path.abspath(options.source_dir)
+        self.duplicates_dir = os.path.join(options.target_dir, "Duplicates")
+
+        # Indexes of fingerprints seen so far and their file paths, matching
+        # within a Hamming distance when a similarity threshold is set. Each
+        # path is stored once in a table shared by all indexes.
+        paths = PathTable()
+        self.photo_index = DuplicateIndex(options.similarity_threshold, paths)
+        self.video_index = DuplicateIndex(options.similarity_threshold, paths)
+        # Collision-free target names, decided in memory
+        self.namer = TargetNamer()
+
+        # Byte-identical copies are caught by size and content hash before any decoding
+        self.exact_index = ExactDuplicateIndex(paths) if options.find_duplicates else None
+
+        # Reuse probe results from previous runs for files that haven't changed
+        if options.use_cache and probing:
+            self.cache = MediaCache(os.path.join(options.target_dir, CACHE_FILENAME))
+
+        # Fingerprints of the files already in the target directory
+        if options.find_duplicates and options.check_library:
+            self.library = self.load_library(self.photo_index, self.video_index, self.exact_index,
+                                             self.duplicates_dir, self._is_canceled)
+
+    def _close(self, error=None):
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+        if self.library:
+            self.library.close()
+            self.library = None
+        # Keep the journal of an unfinished batch so the next run can resume it
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        if self.profiler:
+            self.profiler.export()
+        self.events.finish(self.stats, error)
+
+    def _organize_source(self, handled=None):
+        """Organize every file under the source directory, resuming an interrupted run first."""
+        options = self.options
+        # Count candidate files in the background so organizing can start right away
+        counter = MediaFileCounter(self.source_dir, options.include_photos, options.include_videos,
+                                   self._is_canceled)
+        counter.start()
+        candidates = scan_media_files(self.source_dir, options.include_photos, options.include_videos,
+                                      self._is_canceled)
+        return self._organize(candidates, counter, full_scan=True, handled=handled)
+
+    def _organize(self, candidates, counter=None, total=None, full_scan=False, handled=None, probe=None):
+        """Plan and apply a batch of (path, filename, media_type) candidates.
+
+        Duplicates are found against everything organized so far in this
+        session and the library. A full scan also picks up the journal of an
+        interrupted run and forgets cached files no longer in the source tree.
+        The source of every file transferred is added to handled, if given.
+        probe turns the candidates into (filename, MediaInfo) pairs if they
+        were probed elsewhere. Returns False if the batch was canceled.
+        """
+        options = self.options
+        profiler = self.profiler
+        find_duplicates = options.find_duplicates
+        dry_run = options.dry_run
+        photo_index = self.photo_index
+        video_index = self.video_index
+        exact_index = self.exact_index
+        namer = self.namer
+        duplicates_dir = self.duplicates_dir
+        cancel_check = self._is_canceled
+
+        # Pick up the decisions of an interrupted run from its journal
+        journal_path = os.path.join(options.target_dir, JOURNAL_FILENAME)
+        resumed = replay_journal(journal_path, self.source_dir) if full_scan and not dry_run else None
+        if not dry_run:
+            self.journal = RunJournal(journal_path, self.source_dir, resume=resumed is not None)
+        journal = self.journal
+
+        plan_path = os.path.join(options.target_dir, PLAN_FILENAME)
+        plan = PlanWriter(plan_path)
+        if resumed:
+            self.events.publish("resuming", len(resumed.decisions), stats=self.stats, force=True)
+            for entry in resumed.decisions.values():
+                namer.reserve(entry.target)
+                self.stats["total_files"] += 1
+                if entry.action == ACTION_DUPLICATE:
+                    self.stats["duplicates"] += 1
+                else:
+                    # Rebuild the duplicate state from the organized files
+                    if entry.fingerprint:
+                        hash_index = video_index if entry.media_type == "video" else photo_index
+                        hash_index.add(entry.fingerprint, entry.source)
+                    if exact_index is not None and entry.size is not None:
+                        # Moved files are only found at their target
+                        done_path = entry.target if entry.source in resumed.done else entry.source
+                        exact_index.add(entry.size, [done_path, None, None])
+                    if entry.media_type == "video":
+                        self.stats["organized_videos"] += 1
+                    else:
+                        self.stats["organized_photos"] += 1
+
+                # Transfers that didn't finish go into this run's plan
+                if entry.source not in resumed.done:
+                    plan.add(entry)
+                elif self.library and entry.action == ACTION_ORGANIZE:
+                    # The library writes queued before the crash may be lost
+                    try:
+                        self.library.add(entry.target, entry.media_type, entry.fingerprint)
+                    except OSError:
+                        pass
+
+        # Probe each candidate once (validation, date and fingerprint), optionally
+        # in a pool of worker processes. Files decided by an interrupted run are
+        # not looked at again.
+        if resumed:
+            candidates = (candidate for candidate in candidates
+                          if candidate[0] not in resumed.decisions)
+        if probe is None:
+            probed = iter_probed_media(candidates, find_duplicates, workers=options.workers, cache=self.cache,
+                                       exact_index=exact_index, video_time_budget=options.video_time_budget,
+                                       video_frame_budget=options.video_frame_budget,
+                                       profiler=profiler)
+        else:
+            probed = probe(candidates)
+
+        # Phase 1: plan. Every decision is written to the plan file and the journal,
+        # nothing is transferred yet. Duplicate decisions are made here, one file at
+        # a time in scan order.
+        files_processed = 0
+        bytes_processed = 0
+        with plan:
+            for filename, info in probed:
+                if self.cancel_requested:
+                    probed.close()
+                    return False
+
+                file_path = info.path
+                media_type = info.media_type
+
+                # Skip if not a valid media file
+                if not info.valid:
+                    continue
+
+                self.stats["total_files"] += 1
+                files_processed += 1
+                bytes_processed += info.size or 0
+
+                # Update progress
+                if counter:
+                    self.events.publish("planning", files_processed, max(counter.count, files_processed),
+                                        bytes_processed, stats=self.stats, counting=not counter.done)
+                else:
+                    self.events.publish("planning", files_processed, max(total or 0, files_processed),
+                                        bytes_processed, stats=self.stats)
+
+                if profiler:
+                    started = time.perf_counter()
+                try:
+                    is_video = (media_type == "video")
+
+                    # Byte-identical copy of a file we already handled, found without decoding
+                    if info.duplicate_of is not None:
+                        self.stats["duplicates"] += 1
+                        entry = PlanEntry(ACTION_DUPLICATE, file_path,
+                                          namer.duplicate_path(duplicates_dir, filename),
+                                          media_type, info.duplicate_of, None, info.size)
+                        plan.add(entry)
+                        if journal:
+                            journal.decide(entry)
+                        continue
+
+                    # Get target directory based on organization options
+                    target_dir = self.target_directory(info.year, info.month, media_type)
+
+                    # Find duplicates if enabled
+                    if find_duplicates:
+                        # Media hash computed by the probe
+                        media_hash = info.fingerprint
+                        if media_hash is None and info.error is not None:
+                            self.stats["errors"] += 1
+                            continue
+
+                        # A video without a frame count, or too slow to sample within its budget, has no
+                        # perceptual fingerprint. It is still organized, only byte-identical copies are found.
+                        if media_hash is not None:
+                            # Check for duplicates
+                            hash_index = video_index if is_video else photo_index
+                            if profiler:
+                                find_started = time.perf_counter()
+                            original = hash_index.find(media_hash)
+                            if profiler:
+                                profiler.add("dedup_find", time.perf_counter() - find_started)
+                            if original is not None:
+                                # This is a duplicate
+                                self.stats["duplicates"] += 1
+                                entry = PlanEntry(ACTION_DUPLICATE, file_path,
+                                                  namer.duplicate_path(duplicates_dir, filename),
+                                                  media_type, original, media_hash, info.size)
+                                plan.add(entry)
+                                if journal:
+                                    journal.decide(entry)
+                                continue
+
+                            # New media file, store its hash
+                            hash_index.add(media_hash, file_path)
+
+                    # Plan the file into the target directory, the scan yields each file once
+                    target_path = namer.organized_path(target_dir, filename, file_path)
+                    entry = PlanEntry(ACTION_ORGANIZE, file_path, target_path, media_type, None,
+                                      info.fingerprint, info.size)
+                    plan.add(entry)
+                    if journal:
+                        journal.decide(entry)
+
+                    if is_video:
+                        self.stats["organized_videos"] += 1
+                    else:
+                        self.stats["organized_photos"] += 1
+
+                except Exception as e:
+                    print(f"Error processing {file_path}: {e}")
+                    self.stats["errors"] += 1
+
+                finally:
+                    if profiler:
+                        profiler.add("decide", time.perf_counter() - started)
+                        profiler.maybe_export()
+
+        # Forget cached files that have disappeared from the source tree
+        if self.cache and full_scan:
+            self.cache.evict_unseen(self.source_dir)
+
+        # A dry run stops with the plan written for review
+        if dry_run:
+            return True
+
+        # Phase 2: apply. Directories are created once, then all transfers run in bulk.
+        library = self.library
+        applied = 0
+        bytes_applied = 0
+        resumed_sources = resumed.decisions if resumed else None
+        if profiler:
+            started = time.perf_counter()
+        for entry, error in iter_apply_plan(read_plan(plan_path), options.transfer_mode,
+                                            cancel_check, plan.directories, resumed_sources):
+            if profiler:
+                # Everything since the previous entry went into this transfer
+                profiler.add("transfer", time.perf_counter() - started, entry.size or 0, entry.source)
+            if self.cancel_requested:
+                return False
+
+            applied += 1
+            bytes_applied += entry.size or 0
+            self.events.publish("transferring", applied, plan.count, bytes_applied, plan.bytes,
+                                stats=self.stats)
+
+            if error is None:
+                journal.done(entry.source)
+                if handled is not None:
+                    handled.add(entry.source)
+                # Later runs find this file in the library
+                if library and entry.action == ACTION_ORGANIZE:
+                    try:
+                        library.add(entry.target, entry.media_type, entry.fingerprint)
+                    except OSError:
+                        pass
+            else:
+                journal.failed(entry.source, error)
+                print(f"Error transferring {entry.source}: {error}")
+                self.stats["errors"] += 1
+                # The file was counted when it was planned
+                if entry.action == ACTION_DUPLICATE:
+                    self.stats["duplicates"] -= 1
+                elif entry.media_type == "video":
+                    self.stats["organized_videos"] -= 1
+                else:
+                    self.stats["organized_photos"] -= 1
+
+            if profiler:
+                profiler.maybe_export()
+                started = time.perf_counter()
+
+        # Nothing left to resume
+        journal.finish()
+        self.journal = None
+        # A watch session keeps going, so what this batch learned is saved now
+        if library:
+            library.flush()
+        if self.cache:
+            self.cache.flush()
+        return True
+
+    def run(self):
+        """Organize the source directory into the target directory and return the stats.
+
+        Blocks until the run is done or canceled. Errors with single files are
+        counted in the stats, anything that stops the whole run is raised.
+        The last event published is always a "finished" one.
+        """
+        error = None
+        try:
+            self._open()
+            if not self.cancel_requested and self._organize_source():
+                self.completed = True
+
+        except TransferCanceled:
+            # Canceled in the middle of a large copy
+            pass
+
+        except Exception as e:
+            error = str(e)
+            raise
+
+        finally:
+            self._close(error)
+        return self.stats
+
+    def watch(self, settle=SETTLE_SECONDS, poll_interval=POLL_INTERVAL, polling=False):
+        """Organize the source directory, then keep organizing new files as they arrive.
+
+        Files are handed over by a folder watcher once they stopped changing
+        for settle seconds, and each batch goes through the same planning and
+        transfers as a run, against the duplicate state kept in memory since
+        the start. The tree is not scanned again. Blocks until canceled and
+        returns the stats of the whole session.
+        """
+        options = self.options
+        error = None
+        watcher = None
+        try:
+            check_watch_options(options)
+            self._open()
+            if self.cancel_requested:
+                return self.stats
+
+            # Watch before the first pass so files arriving during it aren't missed
+            watcher = open_watcher(self.source_dir, options.include_photos, options.include_videos,
+                                   settle, poll_interval, polling)
+            # Copied files stay in the source and may be reported again, moved ones are gone
+            handled = HandledFiles() if options.transfer_mode != "move" else None
+            if not self._organize_source(handled):
+                return self.stats
+
+            while not self.cancel_requested:
+                self.events.publish("watching", stats=self.stats)
+                batch = [(path, os.path.basename(path), media_type_for_name(path))
+                         for path in watcher.wait(WATCH_WAIT)
+                         if handled is None or path not in handled]
+                if batch and not self._organize(batch, total=len(batch), handled=handled):
+                    return self.stats
+                if self.profiler:
+                    self.profiler.maybe_export()
+
+            # Stopping the watch is how a session ends
+            self.completed = True
+
+        except TransferCanceled:
+            pass
+
+        except Exception as e:
+            error = str(e)
+            raise
+
+        finally:
+            if watcher:
+                watcher.close()
+            self._close(error)
+        return self.stats
+
+    def build_shard(self, shard, shards, shard_by="hash", shard_path=None):
+        """Probe one slice of the source directory into a shard file and return the stats.
+
+        This is what each node of a sharded run does; nothing is transferred.
+        The shard goes into the target directory of the options unless
+        shard_path is given. Byte-identical copies within the slice are found
+        here, everything else is decided when the shards are merged.
+        """
+        options = self.options
+        profiler = self.profiler
+        cache = None
+        writer = None
+        error = None
+        try:
+            if shard_by not in SHARD_MODES:
+                raise ValueError(f"Unknown shard mode: {shard_by}")
+            if not 0 <= shard < shards:
+                raise ValueError(f"There is no shard {shard + 1} of {shards}.")
+            os.makedirs(options.target_dir, exist_ok=True)
+            if shard_path is None:
+                shard_path = os.path.join(options.target_dir, shard_filename(shard, shards))
+            source_dir = os.path.abspath(options.source_dir)
+
+            # By subtree, the top-level directories of other shards aren't even entered
+            skip_dirs = []
+            if shard_by == "subtree":
+                with os.scandir(source_dir) as it:
+                    skip_dirs = [entry.path for entry in it if entry.is_dir(follow_symlinks=False)
+                                 and shard_of(entry.name, shards, shard_by) != shard]
+            candidates = (candidate for candidate in scan_media_files(source_dir, options.include_photos,
+                                                                      options.include_videos,
+                                                                      self._is_canceled, skip_dirs)
+                          if shard_of(relative_source_path(candidate[0], source_dir), shards, shard_by) == shard)
+
+            # Each shard has its own cache next to it, nodes never share one
+            if options.use_cache:
+                cache = MediaCache(shard_cache_path(shard_path))
+            exact_index = ExactDuplicateIndex(PathTable()) if options.find_duplicates else None
+
+            writer = ShardWriter(shard_path, shard, shards, shard_by, source_dir, options.find_duplicates)
+            probed = iter_probed_media(candidates, options.find_duplicates, workers=options.workers, cache=cache,
+                                       exact_index=exact_index, video_time_budget=options.video_time_budget,
+                                       video_frame_budget=options.video_frame_budget,
+                                       profiler=profiler)
+            for _, info in probed:
+                if self.cancel_requested:
+                    probed.close()
+                    return self.stats
+                if not info.valid:
+                    continue
+
+                self.stats["total_files"] += 1
+                duplicate_of = None
+                if info.duplicate_of is not None:
+                    self.stats["duplicates"] += 1
+                    duplicate_of = relative_source_path(info.duplicate_of, source_dir)
+                elif options.find_duplicates and info.fingerprint is None and info.error is not None:
+                    self.stats["errors"] += 1
+                writer.add(relative_source_path(info.path, source_dir), info, duplicate_of)
+
+                self.events.publish("sharding", writer.files, None, writer.bytes, stats=self.stats)
+                if profiler:
+                    profiler.maybe_export()
+
+            if cache:
+                cache.evict_unseen(source_dir)
+            writer.finish()
+            self.completed = True
+
+        except Exception as e:
+            error = str(e)
+            raise
+
+        finally:
+            # An unfinished shard is dropped, the node runs it again
+            if writer:
+                writer.close()
+            if cache:
+                cache.close()
+            if profiler:
+                profiler.export()
+            self.events.finish(self.stats, error)
+        return self.stats
+
+    def _probed_from_shards(self, candidates):
+        # The candidates of merged shards carry what their node probed
+        for _, filename, _, info in candidates:
+            if not self.options.find_duplicates:
+                info = info._replace(duplicate_of=None)
+            yield filename, info
+
+    def merge_shards(self, shard_paths):
+        """Organize the source directory from the shards of a sharded run and return the stats.
+
+        The files of all shards are merged in the order a single run visits
+        them, so duplicates across shards and of files already in the library
+        are decided just as one run over the whole source would decide them.
+        The merged plan is applied from here, files are not probed again.
+        Shard paths are relative, so the source directory may be mounted
+        elsewhere than on the nodes.
+        """
+        options = self.options
+        readers = []
+        error = None
+        try:
+            readers = open_shards(shard_paths)
+            if options.find_duplicates and not all(reader.header["fingerprints"] for reader in readers):
+                raise ValueError("The shards were built without fingerprints, duplicates can't be found.")
+            self._open(probing=False)
+            if not self.cancel_requested:
+                candidates = iter_merged_shards(readers, self.source_dir)
+                total = sum(reader.files for reader in readers)
+                if self._organize(candidates, total=total, full_scan=True, probe=self._probed_from_shards):
+                    self.completed = True
+
+        except TransferCanceled:
+            pass
+
+        except Exception as e:
+            error = str(e)
+            raise
+
+        finally:
+            for reader in readers:
+                reader.close()
+            self._close(error)
+        return self.stats
+
+
+def _shard_arg(value):
+    """Parse K/N from the command line into a 0-based (shard, shards)."""
+    try:
+        shard, shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected K/N like 2/8, not {value!r}")
+    if not 1 <= shard <= shards:
+        raise argparse.ArgumentTypeError("K must be between 1 and N")
+    return shard - 1, shards
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Organize photos and videos into Year/Month folders and set duplicates aside.")
+    parser.add_argument("source_dir", help="directory to organize")
+    parser.add_argument("target_dir", help="directory to organize into")
+    parser.add_argument("--no-photos", dest="include_photos", action="store_false", help="skip photos")
+    parser.add_argument("--no-videos", dest="include_videos", action="store_false", help="skip videos")
+    parser.add_argument("--no-year", dest="organize_by_year", action="store_false",
+                        help="don't create year folders")
+    parser.add_argument("--no-month", dest="organize_by_month", action="store_false",
+                        help="don't create month folders")
+    parser.add_argument("--no-duplicates", dest="find_duplicates", action="store_false",
+                        help="don't look for duplicates")
+    parser.add_argument("--similarity", dest="similarity_threshold", type=int, default=0,
+                        help="differing fingerprint bits still counted as a duplicate (default: 0)")
+    parser.add_argument("--video-budget", dest="video_time_budget", type=float, default=VIDEO_TIME_BUDGET,
+                        help="max seconds per video fingerprint (default: %(default)s)")
+    parser.add_argument("--video-frames", dest="video_frame_budget", type=int, default=VIDEO_FRAME_BUDGET,
+                        help="max decoded frames per video fingerprint (default: %(default)s)")
+    parser.add_argument("--mode", dest="transfer_mode", choices=TRANSFER_MODES, default="copy",
+                        help="how files get into the target directory (default: copy)")
+    parser.add_argument("--dry-run", action="store_true", help=f"only write {PLAN_FILENAME}")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                        help="don't reuse probe results of earlier runs")
+    parser.add_argument("--no-library", dest="check_library", action="store_false",
+                        help="don't check files already in the target directory")
+    parser.add_argument("--rescan-library", action="store_true",
+                        help="re-index the target directory for changes made by hand")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="worker processes for probing (default: 1)")
+    parser.add_argument("--profile", dest="profile_path", nargs="?", const="", default=None, metavar="FILE",
+                        help=f"write per-stage timings as JSON (default file: {PROFILE_FILENAME} in the target)")
+    how = parser.add_mutually_exclusive_group()
+    how.add_argument("--watch", action="store_true",
+                     help="keep organizing new files as they arrive in the source, until Ctrl+C")
+    how.add_argument("--shard", type=_shard_arg, metavar="K/N",
+                     help="only probe slice K of N of the source and write it as a shard into the target")
+    how.add_argument("--merge-shards", nargs="+", metavar="SHARD",
+                     help="organize the source from the shard files of all N slices")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="seconds a new file must stay unchanged before it is organized (default: %(default)s)")
+    parser.add_argument("--poll", dest="poll_interval", type=float, default=None, metavar="SECONDS",
+                        help="watch by scanning the source every SECONDS instead of using inotify")
+    parser.add_argument("--shard-by", choices=SHARD_MODES, default="hash",
+                        help="slice the source by file path hash or by top-level directory (default: hash)")
+    args = vars(parser.parse_args(argv))
+    # Watching and sharding are ways to run, not options of the run
+    watch = args.pop("watch")
+    settle = max(0.0, args.pop("settle"))
+    poll_interval = args.pop("poll_interval")
+    shard = args.pop("shard")
+    shard_by = args.pop("shard_by")
+    merge_shards = args.pop("merge_shards")
+
+    options = OrganizeOptions(**args)
+    if options.profile_path == "":
+        options = options._replace(profile_path=os.path.join(options.target_dir, PROFILE_FILENAME))
+    options = options._replace(similarity_threshold=min(max(0, options.similarity_threshold), 64),
+                               video_time_budget=max(0.1, options.video_time_budget),
+                               video_frame_budget=max(1, options.video_frame_budget),
+                               workers=max(1, options.workers))
+    try:
+        check_options(options)
+        if watch:
+            check_watch_options(options)
+        os.makedirs(options.target_dir, exist_ok=True)
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+
+    organizer = MediaOrganizer(options)
+    started = time.monotonic()
+    # The run goes on a thread so this one can show progress and catch Ctrl+C.
+    # Its end is told by an event: a Thread.join() interrupted by Ctrl+C may
+    # report the thread as stopped while it still runs.
+    finished = threading.Event()
+
+    def work():
+        try:
+            if watch:
+                organizer.watch(settle, poll_interval or POLL_INTERVAL, poll_interval is not None)
+            elif shard:
+                organizer.build_shard(shard[0], shard[1], shard_by)
+            elif merge_shards:
+                organizer.merge_shards(merge_shards)
+            else:
+                organizer.run()
+        except Exception:
+            # Reported through the last progress event
+            traceback.print_exc()
+        finally:
+            finished.set()
+
+    threading.Thread(target=work, daemon=True).start()
+    meter = ThroughputMeter()
+    show_progress = sys.stderr.isatty()
+    error = None
+    try:
+        while not finished.wait(CLI_PROGRESS_INTERVAL):
+            event = organizer.events.drain()
+            if event is None:
+                continue
+            if event.stage == "finished":
+                error = event.error
+            else:
+                meter.update(event)
+                if show_progress:
+                    print("\r\033[K" + describe(event, meter), end="", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        organizer.cancel()
+        finished.wait()
+        if shard:
+            print("\nInterrupted, the shard was not written", file=sys.stderr)
+            return 130
+        if not watch or not organizer.completed:
+            # The journal is kept, running again resumes
+            print("\nInterrupted, run again with the same directories to resume", file=sys.stderr)
+            return 130
+    if show_progress:
+        print(file=sys.stderr)
+
+    # The run may have ended right after the last look at the channel
+    event = organizer.events.drain()
+    if event is not None and event.stage == "finished":
+        error = event.error
+
+    stats = organizer.stats
+    if error is not None:
+        print(f"An error occurred during processing: {error}", file=sys.stderr)
+        return 2
+
+    if shard:
+        print(f"Shard {shard[0] + 1} of {shard[1]}: {stats['total_files']} files "
+              f"in {time.monotonic() - started:.1f}s\n"
+              f"Byte-identical copies: {stats['duplicates']}\n"
+              f"Errors: {stats['errors']}\n"
+              f"Written to {os.path.join(options.target_dir, shard_filename(*shard))}")
+        return 1 if stats["errors"] else 0
+
+    print(f"Processed: {stats['total_files']} files in {time.monotonic() - started:.1f}s\n"
+          f"Organized photos: {stats['organized_photos']}\n"
+          f"Organized videos: {stats['organized_videos']}\n"
+          f"Duplicates: {stats['duplicates']}\n"
+          f"Errors: {stats['errors']}")
+    if options.dry_run:
+        print(f"Dry run, nothing was transferred. Plan: {os.path.join(options.target_dir, PLAN_FILENAME)}")
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,18 @@
 import os
-import sys
-import shutil
-import hashlib
-import imagehash
-from PIL import Image
-from PIL.ExifTags import TAGS
-from datetime import datetime
-import cv2
-import numpy as np
-from collections import defaultdict
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import threading
-import time
-import calendar
+import traceback
+
+from file_transfer import TRANSFER_MODES
+from media_probe import VIDEO_FRAME_BUDGET, VIDEO_TIME_BUDGET
+from organize_plan import PLAN_FILENAME
+from organizer_engine import MediaOrganizer, OrganizeOptions, check_options, check_watch_options, new_stats
+from progress_channel import ProgressChannel, ThroughputMeter, describe, percent_done
+from run_profiler import PROFILE_FILENAME
+
+# How often the UI picks up progress from the worker thread
+UI_REFRESH_MS = 100
 
 class MediaOrganizerApp:
     def __init__(self, root):
@@ -25,27 +24,23 @@ class MediaOrganizerApp:
         # Set app icon if needed
         # self.root.iconbitmap("path/to/icon.ico")
         
+        # Labels for the transfer modes in the options
+        self.transfer_labels = {
+            "copy": "Copy",
+            "move": "Move",
+            "hardlink": "Hard link",
+            "reflink": "Reflink (clone)"
+        }
+        
         self.setup_ui()
         
         # Initialize variables
         self.source_dir = ""
         self.target_dir = ""
         self.is_processing = False
-        self.stats = {
-            "total_files": 0,
-            "organized_photos": 0,
-            "organized_videos": 0,
-            "duplicates": 0,
-            "errors": 0
-        }
-        
-        # Month names for folder organization
-        self.month_names = {
-            1: "01-January", 2: "02-February", 3: "03-March", 4: "04-April",
-            5: "05-May", 6: "06-June", 7: "07-July", 8: "08-August",
-            9: "09-September", 10: "10-October", 11: "11-November", 12: "12-December",
-            0: "00-Unknown"  # For cases where month can't be determined
-        }
+        self.organizer = None
+        self.watching = False
+        self.stats = new_stats()
     
     def setup_ui(self):
         # Main frame
@@ -115,6 +110,83 @@ class MediaOrganizerApp:
         self.find_duplicates_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(options_frame, text="Find Duplicates", variable=self.find_duplicates_var).pack(anchor=tk.W)
         
+        # Duplicate detection against files organized by earlier runs
+        library_frame = ttk.Frame(options_frame)
+        library_frame.pack(fill=tk.X, anchor=tk.W)
+        
+        self.check_library_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(library_frame, text="Also check files already in the target directory",
+                        variable=self.check_library_var).pack(side=tk.LEFT)
+        
+        self.rescan_library_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(library_frame, text="Rescan it for changes",
+                        variable=self.rescan_library_var).pack(side=tk.LEFT, padx=10)
+        
+        # Near-duplicate threshold
+        similarity_frame = ttk.Frame(options_frame)
+        similarity_frame.pack(fill=tk.X, pady=5, anchor=tk.W)
+        
+        ttk.Label(similarity_frame, text="Similarity threshold (bits, 0 = identical):").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.similarity_var = tk.IntVar(value=0)
+        ttk.Spinbox(similarity_frame, from_=0, to=16, width=5,
+                    textvariable=self.similarity_var).pack(side=tk.LEFT, padx=5)
+        
+        # Time and frame limits for fingerprinting a single video
+        video_budget_frame = ttk.Frame(options_frame)
+        video_budget_frame.pack(fill=tk.X, pady=5, anchor=tk.W)
+        
+        ttk.Label(video_budget_frame, text="Max seconds per video fingerprint:").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.video_budget_var = tk.DoubleVar(value=VIDEO_TIME_BUDGET)
+        ttk.Spinbox(video_budget_frame, from_=1, to=300, width=5,
+                    textvariable=self.video_budget_var).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(video_budget_frame, text="Max frames:").pack(side=tk.LEFT, padx=(10, 10))
+        
+        self.video_frames_var = tk.IntVar(value=VIDEO_FRAME_BUDGET)
+        ttk.Spinbox(video_budget_frame, from_=10, to=100000, increment=100, width=7,
+                    textvariable=self.video_frames_var).pack(side=tk.LEFT, padx=5)
+        
+        # How files get into the target directory
+        transfer_frame = ttk.Frame(options_frame)
+        transfer_frame.pack(fill=tk.X, pady=5, anchor=tk.W)
+        
+        ttk.Label(transfer_frame, text="Transfer files by:").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.transfer_mode_var = tk.StringVar(value=self.transfer_labels["copy"])
+        ttk.Combobox(transfer_frame, textvariable=self.transfer_mode_var, state="readonly", width=20,
+                     values=[self.transfer_labels[mode] for mode in TRANSFER_MODES]).pack(side=tk.LEFT, padx=5)
+        
+        # Dry run: only write the plan
+        self.dry_run_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Dry run (only write the plan to organize_plan.jsonl)",
+                        variable=self.dry_run_var).pack(anchor=tk.W)
+        
+        # Watch mode: keep organizing files as they arrive until canceled
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="Keep watching the source directory for new files",
+                        variable=self.watch_var).pack(anchor=tk.W)
+        
+        # Metadata cache for incremental re-runs
+        self.use_cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(options_frame, text="Cache metadata for faster re-runs", variable=self.use_cache_var).pack(anchor=tk.W)
+        
+        # Per-stage timings for finding slow spots
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text=f"Write a performance profile ({PROFILE_FILENAME})",
+                        variable=self.profile_var).pack(anchor=tk.W)
+        
+        # Parallel analysis
+        workers_frame = ttk.Frame(options_frame)
+        workers_frame.pack(fill=tk.X, pady=5, anchor=tk.W)
+        
+        ttk.Label(workers_frame, text="Worker processes:").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.workers_var = tk.IntVar(value=1)
+        ttk.Spinbox(workers_frame, from_=1, to=os.cpu_count() or 1, width=5,
+                    textvariable=self.workers_var).pack(side=tk.LEFT, padx=5)
+        
         # Progress frame
         progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding=10)
         progress_frame.pack(fill=tk.X, pady=10)
@@ -163,23 +235,69 @@ class MediaOrganizerApp:
         self.source_dir = self.source_entry.get()
         self.target_dir = self.target_entry.get()
         
-        # Validate inputs
-        if not self.source_dir or not os.path.exists(self.source_dir):
-            messagebox.showerror("Error", "Please select a valid source directory.")
+        # Check the similarity threshold
+        try:
+            similarity_threshold = min(max(0, self.similarity_var.get()), 64)
+        except tk.TclError:
+            messagebox.showerror("Error", "Please enter a valid similarity threshold.")
+            return
+        
+        # Check the video fingerprint time limit
+        try:
+            video_time_budget = max(0.1, self.video_budget_var.get())
+        except tk.TclError:
+            messagebox.showerror("Error", "Please enter a valid time limit for video fingerprints.")
             return
         
-        if not self.target_dir:
-            messagebox.showerror("Error", "Please select a target directory.")
+        # Check the video fingerprint frame limit
+        try:
+            video_frame_budget = max(1, self.video_frames_var.get())
+        except tk.TclError:
+            messagebox.showerror("Error", "Please enter a valid frame limit for video fingerprints.")
             return
         
-        # Check if at least one file type is selected
-        if not self.include_photos_var.get() and not self.include_videos_var.get():
-            messagebox.showerror("Error", "Please select at least one file type to process.")
+        # Transfer mode, falling back to copying
+        transfer_mode = "copy"
+        for mode, label in self.transfer_labels.items():
+            if label == self.transfer_mode_var.get():
+                transfer_mode = mode
+        
+        # Check the number of worker processes
+        try:
+            workers = max(1, self.workers_var.get())
+        except tk.TclError:
+            messagebox.showerror("Error", "Please enter a valid number of worker processes.")
             return
         
-        # Check if at least year or month organization is selected
-        if not self.organize_by_year_var.get() and not self.organize_by_month_var.get():
-            messagebox.showerror("Error", "Please select at least one organization method.")
+        # The options are read once here, the engine never touches Tk
+        options = OrganizeOptions(
+            source_dir=self.source_dir,
+            target_dir=self.target_dir,
+            include_photos=self.include_photos_var.get(),
+            include_videos=self.include_videos_var.get(),
+            organize_by_year=self.organize_by_year_var.get(),
+            organize_by_month=self.organize_by_month_var.get(),
+            find_duplicates=self.find_duplicates_var.get(),
+            similarity_threshold=similarity_threshold,
+            video_time_budget=video_time_budget,
+            video_frame_budget=video_frame_budget,
+            transfer_mode=transfer_mode,
+            dry_run=self.dry_run_var.get(),
+            use_cache=self.use_cache_var.get(),
+            check_library=self.check_library_var.get(),
+            rescan_library=self.rescan_library_var.get(),
+            workers=workers,
+            profile_path=os.path.join(self.target_dir, PROFILE_FILENAME) if self.profile_var.get() else None
+        )
+        
+        # Validate inputs
+        self.watching = self.watch_var.get()
+        try:
+            check_options(options)
+            if self.watching:
+                check_watch_options(options)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
         
         # Create target directory if it doesn't exist
@@ -201,13 +319,10 @@ class MediaOrganizerApp:
         self.progress_var.set(0)
         
         # Reset stats
-        self.stats = {
-            "total_files": 0,
-            "organized_photos": 0,
-            "organized_videos": 0,
-            "duplicates": 0,
-            "errors": 0
-        }
+        self.events = ProgressChannel()
+        self.meter = ThroughputMeter()
+        self.organizer = MediaOrganizer(options, self.events)
+        self.stats = new_stats()
         self.update_stats_display()
         
         # Start processing thread
@@ -216,32 +331,62 @@ class MediaOrganizerApp:
         self.processing_thread.start()
         
         # Start a timer to update the UI
-        self.root.after(100, self.check_progress)
+        self.root.after(UI_REFRESH_MS, self.check_progress)
     
     def cancel_processing(self):
         if self.is_processing:
             self.cancel_requested = True
+            self.organizer.cancel()
             self.status_var.set("Canceling...")
     
     def check_progress(self):
-        if self.is_processing:
+        # Runs on the Tk thread at a fixed rate; the worker never touches Tk
+        event = self.events.drain()
+        if event is not None and event.stats is not None and event.stats != self.stats:
+            self.stats = event.stats
             self.update_stats_display()
-            self.root.after(100, self.check_progress)
-        else:
-            # Processing completed or was canceled
-            self.start_button.config(state=tk.NORMAL)
-            self.cancel_button.config(state=tk.DISABLED)
-            
+        
+        if event is not None and event.stage != "finished":
+            self.meter.update(event)
             if not self.cancel_requested:
-                self.status_var.set("Processing completed!")
-                messagebox.showinfo("Complete", f"Media organization complete!\n\n"
-                                  f"Processed: {self.stats['total_files']} files\n"
-                                  f"Organized Photos: {self.stats['organized_photos']} files\n"
-                                  f"Organized Videos: {self.stats['organized_videos']} files\n"
-                                  f"Duplicates: {self.stats['duplicates']} files\n"
-                                  f"Errors: {self.stats['errors']} files")
-            else:
-                self.status_var.set("Processing canceled")
+                self.status_var.set(describe(event, self.meter))
+            percent = percent_done(event)
+            if percent is not None:
+                self.progress_var.set(percent)
+        
+        if event is None or event.stage != "finished":
+            self.root.after(UI_REFRESH_MS, self.check_progress)
+            return
+        
+        # Processing completed, was canceled or failed
+        self.is_processing = False
+        self.start_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        
+        if event.error is not None:
+            self.status_var.set("Processing stopped")
+            messagebox.showerror("Error", f"An error occurred during processing: {event.error}")
+        elif not self.organizer.completed:
+            self.status_var.set("Processing canceled")
+        elif self.organizer.options.dry_run:
+            self.progress_var.set(100)
+            self.status_var.set("Dry run completed!")
+            messagebox.showinfo("Dry Run Complete", f"Nothing was transferred. The plan was written to\n"
+                              f"{os.path.join(self.target_dir, PLAN_FILENAME)}\n\n"
+                              f"Processed: {self.stats['total_files']} files\n"
+                              f"Photos to organize: {self.stats['organized_photos']} files\n"
+                              f"Videos to organize: {self.stats['organized_videos']} files\n"
+                              f"Duplicates: {self.stats['duplicates']} files\n"
+                              f"Errors: {self.stats['errors']} files")
+        else:
+            self.progress_var.set(100)
+            self.status_var.set("Processing completed!")
+            messagebox.showinfo("Complete", f"Media organization complete!\n\n"
+                              f"Processed: {self.stats['total_files']} files\n"
+                              f"Organized Photos: {self.stats['organized_photos']} files\n"
+                              f"Organized Videos: {self.stats['organized_videos']} files\n"
+                              f"Duplicates: {self.stats['duplicates']} files\n"
+                              f"Errors: {self.stats['errors']} files")
     
     def update_stats_display(self):
         self.stats_text.config(state=tk.NORMAL)
@@ -253,283 +398,16 @@ class MediaOrganizerApp:
         self.stats_text.insert(tk.END, f"Errors encountered: {self.stats['errors']}\n")
         self.stats_text.config(state=tk.DISABLED)
     
-    def get_media_date(self, file_path, is_video=False):
-        """Extract date from image EXIF data, video metadata, or use file modification date as fallback."""
-        try:
-            if is_video:
-                # Try to get date from video metadata using OpenCV
-                cap = cv2.VideoCapture(file_path)
-                if cap.isOpened():
-                    # Some video formats might store creation time
-                    # This is a basic approach - more advanced video metadata extraction
-                    # would require additional libraries like ffmpeg-python or pymediainfo
-                    cap.release()
-                    
-                    # For now, fall back to file modification time for videos
-                    mod_time = os.path.getmtime(file_path)
-                    dt = datetime.fromtimestamp(mod_time)
-                    return dt.year, dt.month
-            else:
-                # Try to get date from EXIF data for images
-                with Image.open(file_path) as img:
-                    exif_data = img._getexif()
-                    if exif_data:
-                        for tag_id, value in exif_data.items():
-                            tag = TAGS.get(tag_id, tag_id)
-                            if tag == 'DateTimeOriginal':
-                                # Parse EXIF date format (YYYY:MM:DD HH:MM:SS)
-                                date_str = value
-                                dt = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-                                return dt.year, dt.month
-        except Exception as e:
-            pass
-        
-        # Fallback to file modification time
-        try:
-            mod_time = os.path.getmtime(file_path)
-            dt = datetime.fromtimestamp(mod_time)
-            return dt.year, dt.month
-        except:
-            # If all else fails, return Unknown
-            return "Unknown", 0
-    
-    def compute_media_hash(self, file_path, is_video=False):
-        """Compute hash for an image or video."""
-        try:
-            if is_video:
-                # For videos, we'll use a combination of file size and a sample of frames
-                file_size = os.path.getsize(file_path)
-                
-                # Extract a few frames for comparison
-                cap = cv2.VideoCapture(file_path)
-                if not cap.isOpened():
-                    return None
-                
-                # Get video properties
-                total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                fps = cap.get(cv2.CAP_PROP_FPS)
-                duration = total_frames / fps if fps > 0 else 0
-                
-                # Sample frames at different points
-                sample_points = [0.1, 0.5, 0.9]  # 10%, 50%, 90% of video
-                frames_data = []
-                
-                for point in sample_points:
-                    if duration > 0:
-                        # Set position to percentage of video
-                        target_frame = int(total_frames * point)
-                        cap.set(cv2.CAP_PROP_POS_FRAMES, target_frame)
-                        
-                        ret, frame = cap.read()
-                        if ret:
-                            # Resize frame to small size for faster hashing
-                            small_frame = cv2.resize(frame, (32, 32))
-                            # Convert to grayscale
-                            gray_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
-                            # Add frame data to our collection
-                            frames_data.append(gray_frame.tobytes())
-                
-                cap.release()
-                
-                # Create a hash from the combination of file size and frame data
-                hasher = hashlib.md5()
-                hasher.update(str(file_size).encode())
-                for frame_data in frames_data:
-                    hasher.update(frame_data)
-                
-                return hasher.hexdigest()
-            else:
-                # For images, use perceptual hash
-                with Image.open(file_path) as img:
-                    # Convert to consistent format for hashing
-                    img = img.convert("RGB")
-                    # Calculate perceptual hash - robust against minor changes
-                    return str(imagehash.phash(img))
-        except Exception as e:
-            # Return None if we can't process the file
-            return None
-
-    def is_valid_media(self, file_path):
-        """Check if file is a valid image or video."""
-        # Get file extension
-        file_ext = os.path.splitext(file_path)[1].lower()
-        
-        # Define valid extensions
-        valid_image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp']
-        valid_video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v', '.3gp']
-        
-        # Check if it's an image file
-        if self.include_photos_var.get() and file_ext in valid_image_extensions:
-            try:
-                with Image.open(file_path) as img:
-                    # Try to verify the image
-                    img.verify()
-                return "image"
-            except:
-                return False
-        
-        # Check if it's a video file
-        if self.include_videos_var.get() and file_ext in valid_video_extensions:
-            try:
-                # Try to open video file using OpenCV
-                cap = cv2.VideoCapture(file_path)
-                if cap.isOpened():
-                    cap.release()
-                    return "video"
-                return False
-            except:
-                return False
-        
-        return False
-    
-    def get_target_directory(self, year, month, media_type):
-        """Create and return the target directory path based on organization options."""
-        target_dir = self.target_dir
-        
-        # Organize by year if enabled
-        if self.organize_by_year_var.get():
-            target_dir = os.path.join(target_dir, str(year))
-        
-        # Organize by month if enabled
-        if self.organize_by_month_var.get() and month > 0:
-            month_name = self.month_names.get(month, "00-Unknown")
-            target_dir = os.path.join(target_dir, month_name)
-        
-        # Create media type subdirectory
-        if media_type == "video":
-            target_dir = os.path.join(target_dir, "Videos")
-        else:
-            target_dir = os.path.join(target_dir, "Photos")
-        
-        # Create directory if it doesn't exist
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-        
-        return target_dir
-    
     def process_media(self):
-        """Process photos and videos in a separate thread."""
+        """Run the organizer in a separate thread."""
         try:
-            # Create duplicates directory if needed
-            duplicates_dir = os.path.join(self.target_dir, "Duplicates")
-            if self.find_duplicates_var.get() and not os.path.exists(duplicates_dir):
-                os.makedirs(duplicates_dir)
-            
-            # First, count total files to set up progress bar
-            total_media_files = 0
-            for root, _, files in os.walk(self.source_dir):
-                for filename in files:
-                    file_path = os.path.join(root, filename)
-                    if self.is_valid_media(file_path):
-                        total_media_files += 1
-            
-            # Dictionary to store hashes and corresponding file paths
-            hash_dict = {}
-            # Track which files have been copied
-            processed_files = set()
-            
-            # Walk through the source directory
-            files_processed = 0
-            for root, _, files in os.walk(self.source_dir):
-                for filename in files:
-                    if self.cancel_requested:
-                        self.is_processing = False
-                        return
-                    
-                    file_path = os.path.join(root, filename)
-                    
-                    # Skip if not a valid media file
-                    media_type = self.is_valid_media(file_path)
-                    if not media_type:
-                        continue
-                    
-                    self.stats["total_files"] += 1
-                    files_processed += 1
-                    
-                    # Update progress
-                    if total_media_files > 0:
-                        progress = (files_processed / total_media_files) * 100
-                        self.progress_var.set(progress)
-                        self.status_var.set(f"Processing file {files_processed} of {total_media_files}")
-                    
-                    try:
-                        is_video = (media_type == "video")
-                        
-                        # Get year and month from media file
-                        year, month = self.get_media_date(file_path, is_video)
-                        
-                        # Get target directory based on organization options
-                        target_dir = self.get_target_directory(year, month, media_type)
-                        
-                        # Find duplicates if enabled
-                        if self.find_duplicates_var.get():
-                            # Compute media hash
-                            media_hash = self.compute_media_hash(file_path, is_video)
-                            if media_hash is None:
-                                self.stats["errors"] += 1
-                                continue
-                            
-                            # Check for duplicates
-                            if media_hash in hash_dict:
-                                # This is a duplicate
-                                self.stats["duplicates"] += 1
-                                duplicate_path = os.path.join(duplicates_dir, filename)
-                                
-                                # Ensure we don't overwrite existing files in the duplicates folder
-                                if os.path.exists(duplicate_path):
-                                    base, ext = os.path.splitext(filename)
-                                    duplicate_path = os.path.join(duplicates_dir, f"{base}_dup_{self.stats['duplicates']}{ext}")
-                                
-                                # Copy to duplicates folder
-                                shutil.copy2(file_path, duplicate_path)
-                            else:
-                                # New media file, store its hash
-                                hash_dict[media_hash] = file_path
-                                
-                                # Copy to target directory if not already processed
-                                if file_path not in processed_files:
-                                    target_path = os.path.join(target_dir, filename)
-                                    
-                                    # Ensure we don't overwrite existing files
-                                    if os.path.exists(target_path):
-                                        base, ext = os.path.splitext(filename)
-                                        target_path = os.path.join(target_dir, f"{base}_{hash(file_path)}{ext}")
-                                    
-                                    shutil.copy2(file_path, target_path)
-                                    processed_files.add(file_path)
-                                    
-                                    if is_video:
-                                        self.stats["organized_videos"] += 1
-                                    else:
-                                        self.stats["organized_photos"] += 1
-                        else:
-                            # Just organize without duplicate detection
-                            target_path = os.path.join(target_dir, filename)
-                            
-                            # Ensure we don't overwrite existing files
-                            if os.path.exists(target_path):
-                                base, ext = os.path.splitext(filename)
-                                target_path = os.path.join(target_dir, f"{base}_{hash(file_path)}{ext}")
-                            
-                            shutil.copy2(file_path, target_path)
-                            
-                            if is_video:
-                                self.stats["organized_videos"] += 1
-                            else:
-                                self.stats["organized_photos"] += 1
-                            
-                    except Exception as e:
-                        print(f"Error processing {file_path}: {e}")
-                        self.stats["errors"] += 1
-            
-            # Processing completed
-            self.progress_var.set(100)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred during processing: {e}")
-        
-        finally:
-            self.is_processing = False
+            if self.watching:
+                self.organizer.watch()
+            else:
+                self.organizer.run()
+        except Exception:
+            # Reported to the UI through the last progress event
+            traceback.print_exc()
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,146 @@
+import time
+from collections import deque, namedtuple
+
+# A worker publishes at most one event per interval, except for forced ones
+PUBLISH_INTERVAL = 0.1
+
+# Events not drained yet beyond this many are dropped, oldest first
+MAX_PENDING_EVENTS = 64
+
+# Rates are measured over the last few seconds
+RATE_WINDOW = 5.0
+
+# What the UI shows for each stage of a run
+STAGE_LABELS = {
+    "indexing": "Indexing files already in the target directory",
+    "loading": "Loading the target library index",
+    "resuming": "Resuming interrupted run",
+    "planning": "Planning file",
+    "transferring": "Transferring file",
+    "watching": "Watching for new files",
+    "sharding": "Probing the files of this shard",
+}
+
+# Snapshot of a run's progress; counts are cumulative so any event can be dropped
+ProgressEvent = namedtuple("ProgressEvent", [
+    "time",         # time.monotonic() when published
+    "stage",        # key of STAGE_LABELS, or "finished"
+    "done",         # files done in this stage
+    "total",        # files in this stage, None if unknown
+    "counting",     # True while total is still growing
+    "bytes_done",   # bytes of the files done in this stage
+    "bytes_total",  # bytes of all files in this stage, None if unknown
+    "stats",        # copy of the run's stats dict
+    "error",        # message of the error that stopped the run, if any
+])
+
+
+class ProgressChannel:
+    """Pass progress from a worker thread to a UI without the worker touching the UI.
+
+    publish() is cheap enough to call for every file: it returns right away
+    unless an interval has passed since the last event, so the consumer sees
+    at most a few events per poll and only the latest one matters. The
+    pending events are bounded, so nobody has to drain them.
+    """
+
+    def __init__(self, interval=PUBLISH_INTERVAL):
+        self.interval = interval
+        self.events = deque(maxlen=MAX_PENDING_EVENTS)
+        self.last_publish = 0.0
+
+    def publish(self, stage, done=0, total=None, bytes_done=0, bytes_total=None, stats=None,
+                counting=False, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_publish < self.interval:
+            return
+        self.last_publish = now
+        self.events.append(ProgressEvent(now, stage, done, total, counting, bytes_done, bytes_total,
+                                         dict(stats) if stats is not None else None, None))
+
+    def finish(self, stats=None, error=None):
+        """Publish the last event of a run."""
+        self.events.append(ProgressEvent(time.monotonic(), "finished", 0, None, False, 0, None,
+                                         dict(stats) if stats is not None else None, error))
+
+    def drain(self):
+        """Return the most recent event published since the last call, or None."""
+        event = None
+        # deque appends and pops are atomic, no lock needed
+        while True:
+            try:
+                event = self.events.popleft()
+            except IndexError:
+                return event
+
+
+class ThroughputMeter:
+    """Files per second, bytes per second and time left, from the events of one stage."""
+
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self.stage = None
+        self.samples = deque()
+
+    def update(self, event):
+        if event.stage != self.stage:
+            self.stage = event.stage
+            self.samples.clear()
+        self.samples.append((event.time, event.done, event.bytes_done))
+        while len(self.samples) > 2 and event.time - self.samples[1][0] >= self.window:
+            self.samples.popleft()
+
+    def rates(self):
+        """Return (files_per_second, bytes_per_second), zeros until there are two samples."""
+        if len(self.samples) < 2:
+            return 0.0, 0.0
+        (start, files, size), (end, last_files, last_size) = self.samples[0], self.samples[-1]
+        elapsed = end - start
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (last_files - files) / elapsed, (last_size - size) / elapsed
+
+    def eta(self, event):
+        """Seconds until the stage is done, or None if it can't be told yet."""
+        files_rate, bytes_rate = self.rates()
+        # Bytes are the better measure when files differ a lot in size
+        if event.bytes_total and bytes_rate > 0:
+            return max(0.0, (event.bytes_total - event.bytes_done) / bytes_rate)
+        if event.total and not event.counting and files_rate > 0:
+            return max(0.0, (event.total - event.done) / files_rate)
+        return None
+
+
+def describe(event, meter):
+    """One line status text for an event, with throughput and ETA where known."""
+    label = STAGE_LABELS.get(event.stage, event.stage)
+    if event.stage in ("planning", "transferring"):
+        if event.counting:
+            text = f"{label} {event.done} (still counting, {event.total} found so far)"
+        elif event.total:
+            text = f"{label} {event.done} of {event.total}"
+        else:
+            text = f"{label} {event.done}"
+    elif event.done:
+        text = f"{label} ({event.done} done)"
+    else:
+        text = f"{label}..."
+
+    files_rate, bytes_rate = meter.rates()
+    if files_rate > 0:
+        text += f" - {files_rate:.0f} files/s, {bytes_rate / (1024 * 1024):.1f} MB/s"
+        eta = meter.eta(event)
+        if eta is not None:
+            minutes, seconds = divmod(int(eta), 60)
+            hours, minutes = divmod(minutes, 60)
+            text += f", {hours}:{minutes:02d}:{seconds:02d} left"
+    return text
+
+
+def percent_done(event):
+    """Progress of the event's stage in percent, None if unknown."""
+    if event.bytes_total:
+        return min(100.0, event.bytes_done * 100.0 / event.bytes_total)
+    if event.total and not event.counting:
+        return min(100.0, event.done * 100.0 / event.total)
+    return None
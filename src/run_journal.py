@@ -0,0 +1,107 @@
+import os
+import json
+import time
+from collections import namedtuple
+
+from organize_plan import PlanEntry
+
+# Journal file kept in the target directory while a run is in progress
+JOURNAL_FILENAME = ".organize_journal.jsonl"
+
+# Records are fsynced in batches: after this many records or this many seconds
+SYNC_EVERY_RECORDS = 256
+SYNC_EVERY_SECONDS = 1.0
+
+# Everything a restarted run needs to pick up where the last one stopped
+JournalState = namedtuple("JournalState", [
+    "decisions",  # {source: PlanEntry} in the order they were made
+    "done",       # set of sources whose transfer completed
+])
+
+
+class RunJournal:
+    """Append-only record of the decisions and transfers of a run.
+
+    Each line is a JSON object. Writes are buffered and fsynced in batches,
+    so at most the last batch is lost when the process is killed; a torn last
+    line is ignored on replay. Replaying a journal rebuilds the duplicate
+    state of the interrupted run and tells which transfers still have to run.
+    """
+
+    def __init__(self, journal_path, source_dir, resume=False):
+        self.journal_path = journal_path
+        self.file = open(journal_path, "a" if resume else "w", encoding="utf-8")
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self._write({"op": "start", "source_dir": source_dir, "resume": resume})
+        self.sync()
+
+    def decide(self, entry):
+        """Record a planning decision."""
+        record = entry._asdict()
+        record["op"] = "decide"
+        self._write(record)
+
+    def done(self, source):
+        """Record that the transfer of source completed."""
+        self._write({"op": "done", "source": source})
+
+    def failed(self, source, error):
+        """Record that the transfer of source failed."""
+        self._write({"op": "failed", "source": source, "error": str(error)})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.unsynced += 1
+        if self.unsynced >= SYNC_EVERY_RECORDS or time.monotonic() - self.last_sync >= SYNC_EVERY_SECONDS:
+            self.sync()
+
+    def sync(self):
+        """Flush buffered records and force them to disk."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+    def finish(self):
+        """Close and delete the journal after a run completed cleanly."""
+        self.file.close()
+        os.remove(self.journal_path)
+
+
+def replay_journal(journal_path, source_dir):
+    """Read the journal left by an interrupted run over source_dir.
+
+    Returns a JournalState, or None if there is no journal or it belongs to
+    a run over a different source directory.
+    """
+    decisions = {}
+    done = set()
+    try:
+        with open(journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write at the end of the file
+                    break
+
+                op = record.pop("op", None)
+                if op == "start":
+                    if record.get("source_dir") != source_dir:
+                        return None
+                elif op == "decide":
+                    entry = PlanEntry(**record)
+                    decisions[entry.source] = entry
+                elif op == "done":
+                    done.add(record["source"])
+                elif op == "failed":
+                    done.discard(record["source"])
+    except OSError:
+        return None
+
+    return JournalState(decisions, done)
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import heapq
+
+# Profile file written into the target directory
+PROFILE_FILENAME = "organize_profile.json"
+
+# Seconds between exports while a run is going
+EXPORT_INTERVAL = 30.0
+
+# Slowest files kept per stage
+SLOWEST_FILES = 20
+
+# Latency histogram buckets: bucket k counts durations below 2**k microseconds
+HISTOGRAM_BUCKETS = 26
+
+
+class StageStats:
+    """Count, time, bytes and latency histogram of one stage."""
+
+    __slots__ = ("count", "seconds", "max_seconds", "bytes", "histogram", "slowest")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+        # Min-heap of (seconds, path) of the slowest files
+        self.slowest = []
+
+    def to_dict(self):
+        histogram = {}
+        for bucket, count in enumerate(self.histogram):
+            if count:
+                histogram["<%dus" % (1 << bucket) if bucket < HISTOGRAM_BUCKETS - 1 else "longer"] = count
+        return {
+            "count": self.count,
+            "seconds": round(self.seconds, 6),
+            "mean_ms": round(self.seconds * 1000 / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 3),
+            "bytes": self.bytes,
+            "histogram": histogram,
+            "slowest": [{"path": path, "ms": round(seconds * 1000, 3)}
+                        for seconds, path in sorted(self.slowest, reverse=True)],
+        }
+
+
+class StageProfiler:
+    """Per-stage timers and counters of a run, exported as JSON.
+
+    Callers keep a profiler of None when profiling is off and guard every
+    measurement with it, so a normal run doesn't even read the clock.
+    Durations go into a power-of-two histogram per stage, and the slowest
+    files of each stage are kept. Probe workers measure their stages
+    themselves and the results are added here by the coordinator.
+    """
+
+    def __init__(self, export_path=None, export_interval=EXPORT_INTERVAL, slowest_files=SLOWEST_FILES):
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.slowest_files = slowest_files
+        self.stages = {}
+        self.counters = {}
+        self.started = time.time()
+        self.next_export = time.monotonic() + export_interval
+
+    def add(self, stage, seconds, nbytes=0, path=None):
+        """Record one measurement of a stage."""
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats()
+        stats.count += 1
+        stats.seconds += seconds
+        stats.bytes += nbytes
+        if seconds > stats.max_seconds:
+            stats.max_seconds = seconds
+        stats.histogram[min(int(seconds * 1000000).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        if path is not None:
+            if len(stats.slowest) < self.slowest_files:
+                heapq.heappush(stats.slowest, (seconds, path))
+            elif seconds > stats.slowest[0][0]:
+                heapq.heapreplace(stats.slowest, (seconds, path))
+
+    def count(self, name, amount=1):
+        """Increase a counter, such as decoded frames or cache hits."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_timings(self, timings, path=None):
+        """Add the {stage: seconds} and {"#counter": amount} a probe worker measured."""
+        for name, value in timings.items():
+            if name.startswith("#"):
+                self.count(name[1:], value)
+            else:
+                self.add(name, value, path=path)
+
+    def report(self):
+        return {
+            "started": self.started,
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            "stages": {stage: stats.to_dict() for stage, stats in sorted(self.stages.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def export(self):
+        """Write the report to export_path, replacing the previous one atomically."""
+        if not self.export_path:
+            return
+        temp_path = self.export_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(temp_path, self.export_path)
+
+    def maybe_export(self):
+        """Export if the export interval has passed since the last one."""
+        now = time.monotonic()
+        if now >= self.next_export:
+            self.next_export = now + self.export_interval
+            self.export()
@@ -0,0 +1,181 @@
+import os
+import json
+import zlib
+import heapq
+
+from media_cache import CACHE_FILENAME
+from media_probe import MediaInfo
+
+# Bump when the shard file format changes
+SHARD_VERSION = 1
+
+# How the source directory is sliced between shards
+SHARD_MODES = ("hash", "subtree")
+
+# Bytes read from the end of a shard to find its summary line
+_SUMMARY_READ = 4096
+
+
+def shard_filename(shard, shards):
+    """File name of a shard, numbered from 1 like on the command line."""
+    return "organize_shard_%03d_of_%03d.jsonl" % (shard + 1, shards)
+
+
+def shard_cache_path(shard_path):
+    """Probe cache of the node writing shard_path, hidden so a glob for the shards skips it."""
+    directory, name = os.path.split(shard_path)
+    return os.path.join(directory, "." + os.path.splitext(name)[0] + CACHE_FILENAME)
+
+
+def relative_source_path(path, source_dir):
+    """Path below source_dir with "/" separators, the same on every node."""
+    return os.path.relpath(path, source_dir).replace(os.sep, "/")
+
+
+def shard_of(relative_path, shards, shard_by="hash"):
+    """Return the shard (0 to shards - 1) a source file belongs to.
+
+    "hash" spreads single files evenly. "subtree" keeps everything below a
+    top-level directory in one shard, so each node only walks its own part
+    of the tree. Both only depend on the relative path, so every node
+    computes the same slices.
+    """
+    if shard_by == "subtree":
+        relative_path = relative_path.split("/", 1)[0]
+    return zlib.crc32(relative_path.encode("utf-8", "surrogateescape")) % shards
+
+
+def scan_order_key(relative_path):
+    """Sort key giving the order scan_media_files visits files in: a directory's files before its subdirectories."""
+    parts = relative_path.split("/")
+    return parts[:-1], parts[-1]
+
+
+class ShardWriter:
+    """Write the probe results of one shard to a self-contained JSON Lines file.
+
+    The first line describes the shard, then comes one line per valid media
+    file in scan order, with paths relative to the source directory. The
+    file is written under a temporary name and only renamed into place by
+    finish(), so a shard that exists is complete.
+    """
+
+    def __init__(self, shard_path, shard, shards, shard_by, source_dir, fingerprints):
+        self.shard_path = shard_path
+        # Hidden like the cache, an unfinished shard is never picked up by a glob
+        directory, name = os.path.split(shard_path)
+        self.temp_path = os.path.join(directory, "." + name + ".tmp")
+        self.files = 0
+        self.bytes = 0
+        self.file = open(self.temp_path, "w", encoding="utf-8")
+        self._write({"version": SHARD_VERSION, "shard": shard, "shards": shards, "shard_by": shard_by,
+                     "source_dir": source_dir, "fingerprints": fingerprints})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def add(self, relative_path, info, duplicate_of=None):
+        """Record a probed file; duplicate_of is the relative path of a byte-identical file of this shard."""
+        self._write({"path": relative_path, "media_type": info.media_type, "year": info.year,
+                     "month": info.month, "fingerprint": info.fingerprint, "size": info.size,
+                     "error": info.error, "duplicate_of": duplicate_of})
+        self.files += 1
+        self.bytes += info.size or 0
+
+    def finish(self):
+        """Write the summary line and move the shard into place."""
+        self._write({"end": True, "files": self.files, "bytes": self.bytes})
+        self.file.close()
+        os.replace(self.temp_path, self.shard_path)
+
+    def close(self):
+        """Drop the shard unless finish() was called."""
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.temp_path)
+
+
+class ShardReader:
+    """Read a shard file written by ShardWriter."""
+
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        self.file = open(shard_path, encoding="utf-8")
+        try:
+            self.header = json.loads(self.file.readline())
+            summary = self._read_summary()
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{shard_path} is not a shard file")
+        if self.header.get("version") != SHARD_VERSION or not summary.get("end"):
+            self.file.close()
+            raise ValueError(f"{shard_path} is not a complete shard of this version")
+        self.files = summary["files"]
+        self.bytes = summary["bytes"]
+
+    def _read_summary(self):
+        with open(self.shard_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - _SUMMARY_READ))
+            last_line = f.read().rstrip(b"\n").rsplit(b"\n", 1)[-1]
+        return json.loads(last_line)
+
+    def __iter__(self):
+        """Yield the records of the shard as dicts."""
+        for line in self.file:
+            record = json.loads(line)
+            if record.get("end"):
+                return
+            yield record
+
+    def close(self):
+        self.file.close()
+
+
+def open_shards(shard_paths):
+    """Open the shard files of one sharded run, checking that they fit together.
+
+    Raises ValueError if a shard is missing, incomplete, given twice or
+    comes from a run that was sliced differently.
+    """
+    readers = []
+    try:
+        for path in shard_paths:
+            readers.append(ShardReader(path))
+        if not readers:
+            raise ValueError("No shard files given.")
+        first = readers[0].header
+        for reader in readers:
+            header = reader.header
+            if (header["shards"], header["shard_by"]) != (first["shards"], first["shard_by"]):
+                raise ValueError(f"{reader.shard_path} is from a run sliced into "
+                                 f"{header['shards']} shards by {header['shard_by']}, "
+                                 f"not {first['shards']} by {first['shard_by']}")
+        found = sorted(reader.header["shard"] for reader in readers)
+        if found != list(range(first["shards"])):
+            missing = sorted(set(range(first["shards"])) - set(found))
+            if missing:
+                raise ValueError("Missing shards: " + ", ".join(str(shard + 1) for shard in missing))
+            raise ValueError("A shard was given more than once.")
+    except Exception:
+        for reader in readers:
+            reader.close()
+        raise
+    return readers
+
+
+def iter_merged_shards(readers, source_dir):
+    """Yield (file_path, filename, media_type, MediaInfo) from all shards in single-run scan order.
+
+    Paths are resolved below source_dir, which may be mounted somewhere else
+    than on the nodes that wrote the shards.
+    """
+    records = heapq.merge(*readers, key=lambda record: scan_order_key(record["path"]))
+    for record in records:
+        file_path = os.path.join(source_dir, *record["path"].split("/"))
+        duplicate_of = record["duplicate_of"]
+        if duplicate_of is not None:
+            duplicate_of = os.path.join(source_dir, *duplicate_of.split("/"))
+        info = MediaInfo(file_path, record["media_type"], True, record["year"], record["month"],
+                         record["fingerprint"], None, None, record["size"], record["error"], duplicate_of)
+        yield file_path, os.path.basename(file_path), record["media_type"], info
@@ -0,0 +1,157 @@
+import struct
+from datetime import datetime, timedelta, timezone
+
+# Epochs used by the containers
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+MATROSKA_EPOCH = datetime(2001, 1, 1, tzinfo=timezone.utc)
+
+# ISO base media (MP4/MOV/3GP/M4V) boxes we look at
+BOX_MOOV = b"moov"
+BOX_MVHD = b"mvhd"
+
+# Matroska/WebM element ids
+EBML_HEADER = 0x1A45DFA3
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_DATE_UTC = 0x4461
+MKV_CLUSTER = 0x1F43B675
+
+# Don't walk more than this many top-level elements looking for the header
+MAX_ELEMENTS = 256
+
+
+def read_video_creation_date(file_path):
+    """Return the creation time stored in an MP4/MOV/3GP/M4V or Matroska/WebM container.
+
+    Only the container structure is read, with seeks over the media data, so
+    no decoder is involved and a moov box at the end of the file is found
+    just as quickly as one at the start. Returns a UTC datetime, or None if
+    the container is not supported or has no creation time.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            magic = f.read(12)
+            f.seek(0)
+            if magic[:4] == struct.pack(">I", EBML_HEADER):
+                return _matroska_date(f)
+            if magic[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"):
+                return _mp4_date(f)
+    except (OSError, EOFError, struct.error, ValueError, OverflowError):
+        # Unreadable, or truncated like after an interrupted transfer
+        pass
+    return None
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) < size:
+        raise EOFError
+    return data
+
+
+def _iter_boxes(f, start, end):
+    """Yield (type, payload_offset, box_end) for the boxes between start and end."""
+    pos = start
+    for _ in range(MAX_ELEMENTS):
+        if end is not None and pos + 8 > end:
+            return
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = pos + 8
+        if size == 1:
+            # 64-bit size follows the type
+            size = struct.unpack(">Q", _read_exact(f, 8))[0]
+            payload += 8
+        elif size == 0:
+            # Box extends to the end of the file
+            f.seek(0, 2)
+            size = f.tell() - pos
+        if size < payload - pos:
+            return
+        yield box_type, payload, pos + size
+        pos += size
+
+
+def _mp4_date(f):
+    for box_type, payload, box_end in _iter_boxes(f, 0, None):
+        if box_type != BOX_MOOV:
+            continue
+        for child_type, child_payload, _ in _iter_boxes(f, payload, box_end):
+            if child_type != BOX_MVHD:
+                continue
+            f.seek(child_payload)
+            version = _read_exact(f, 4)[0]
+            if version == 1:
+                created = struct.unpack(">Q", _read_exact(f, 8))[0]
+            else:
+                created = struct.unpack(">I", _read_exact(f, 4))[0]
+            # Zero means the muxer didn't set it
+            if not created:
+                return None
+            return MP4_EPOCH + timedelta(seconds=created)
+        return None
+    return None
+
+
+def _read_vint(f, keep_marker):
+    """Read an EBML variable length integer, return (value, is_unknown_size)."""
+    first = f.read(1)
+    if not first:
+        raise EOFError
+    first = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("invalid EBML integer")
+
+    value = first if keep_marker else first & (mask - 1)
+    rest = _read_exact(f, length - 1)
+    for byte in rest:
+        value = (value << 8) | byte
+    all_ones = not keep_marker and value == (1 << (7 * length)) - 1
+    return value, all_ones
+
+
+def _iter_elements(f, start, end):
+    """Yield (element_id, data_offset, element_end) for EBML elements between start and end."""
+    pos = start
+    for _ in range(MAX_ELEMENTS):
+        if end is not None and pos >= end:
+            return
+        f.seek(pos)
+        try:
+            element_id, _ = _read_vint(f, keep_marker=True)
+            size, unknown = _read_vint(f, keep_marker=False)
+        except EOFError:
+            return
+        data = f.tell()
+        yield element_id, data, None if unknown else data + size
+        if unknown:
+            return
+        pos = data + size
+
+
+def _matroska_date(f):
+    for element_id, data, element_end in _iter_elements(f, 0, None):
+        if element_id != MKV_SEGMENT:
+            continue
+        for child_id, child_data, child_end in _iter_elements(f, data, element_end):
+            if child_id == MKV_CLUSTER or child_end is None:
+                # Media data starts, Info normally comes before it
+                return None
+            if child_id != MKV_INFO:
+                continue
+            for info_id, info_data, info_end in _iter_elements(f, child_data, child_end):
+                if info_id == MKV_DATE_UTC and info_end == info_data + 8:
+                    f.seek(info_data)
+                    nanoseconds = struct.unpack(">q", _read_exact(f, 8))[0]
+                    return MATROSKA_EPOCH + timedelta(microseconds=nanoseconds // 1000)
+            return None
+        return None
+    return None
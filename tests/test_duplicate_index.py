@@ -0,0 +1,188 @@
+import random
+
+import numpy as np
+
+from duplicate_index import DuplicateIndex, ExactDuplicateIndex, MultiIndexHash, PathTable, hamming_distance
+
+
+def flip_bits(value, count, rng):
+    """value with count distinct random bits flipped."""
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def hex_hash(value):
+    return "%016x" % value
+
+
+def brute_force(hashes, value, radius):
+    return sorted((hamming_distance(h, value), hash_id) for hash_id, h in enumerate(hashes)
+                  if hamming_distance(h, value) <= radius)
+
+
+def test_radius_search_matches_brute_force():
+    rng = random.Random(1)
+    # Enough hashes that some are merged into the block arrays and some are not
+    hashes = [rng.getrandbits(64) for _ in range(MultiIndexHash.MERGE_EVERY + 1500)]
+    # Near copies, so every radius has matches to find
+    for i in range(0, 3000, 7):
+        hashes.append(flip_bits(hashes[i], rng.randrange(0, 20), rng))
+    tree = MultiIndexHash()
+    for h in hashes:
+        tree.add(h)
+    assert 0 < tree.merged < len(tree)
+
+    for radius in (0, 1, 3, 4, 5, 8, 11, 12, 16):
+        for i in range(40):
+            value = flip_bits(hashes[rng.randrange(len(hashes))], rng.randrange(0, radius + 3), rng)
+            assert tree.find_within(value, radius) == brute_force(hashes, value, radius), (radius, i)
+
+
+def flip_block_bits(value, counts, rng):
+    """value with counts[i] random bits flipped in 16-bit block i."""
+    for block, count in enumerate(counts):
+        for bit in rng.sample(range(16), count):
+            value ^= 1 << (block * 16 + bit)
+    return value
+
+
+def test_radius_search_finds_differences_spread_over_blocks():
+    # The worst cases for the pigeonhole argument: as many blocks as possible
+    # differ in just more bits than the per-block radius
+    rng = random.Random(6)
+    hashes = [rng.getrandbits(64) for _ in range(MultiIndexHash.MERGE_EVERY)]
+    tree = MultiIndexHash()
+    for h in hashes:
+        tree.add(h)
+    assert tree.merged == len(tree)
+
+    for radius in (1, 3, 4, 7, 8, 12, 15):
+        far = radius // 4 + 1
+        spreads = {tuple(rng.randrange(0, radius + 1) for _ in range(4)) for _ in range(200)}
+        spreads = {counts for counts in spreads if sum(counts) <= radius + 1}
+        for far_blocks in range(1, 4):
+            for first in range(4):
+                counts = [0] * 4
+                for k in range(far_blocks):
+                    counts[(first + k) % 4] = far
+                if sum(counts) <= radius:
+                    spreads.add(tuple(counts))
+        for counts in sorted(spreads):
+            stored = hashes[rng.randrange(len(hashes))]
+            value = flip_block_bits(stored, counts, rng)
+            assert tree.find_within(value, radius) == brute_force(hashes, value, radius), (radius, counts)
+
+
+def test_radius_search_on_an_empty_index():
+    assert MultiIndexHash().find_within(12345, 8) == []
+
+
+def test_photo_threshold_boundary():
+    rng = random.Random(2)
+    for threshold in (0, 1, 4, 6, 10):
+        index = DuplicateIndex(threshold)
+        original = rng.getrandbits(64)
+        index.add(hex_hash(original), "/photos/original.jpg")
+        assert index.find(hex_hash(flip_bits(original, threshold, rng))) == "/photos/original.jpg"
+        assert index.find(hex_hash(flip_bits(original, threshold + 1, rng))) is None
+
+
+def test_closest_match_wins():
+    rng = random.Random(3)
+    original = rng.getrandbits(64)
+    index = DuplicateIndex(8)
+    index.add(hex_hash(flip_bits(original, 6, rng)), "/photos/far.jpg")
+    index.add(hex_hash(flip_bits(original, 2, rng)), "/photos/near.jpg")
+    assert index.find(hex_hash(original)) == "/photos/near.jpg"
+
+
+def video_fingerprint(frames):
+    return "-".join(hex_hash(frame) for frame in frames)
+
+
+def test_video_frames_all_have_to_match():
+    rng = random.Random(4)
+    threshold = 4
+    frames = [rng.getrandbits(64) for _ in range(5)]
+    index = DuplicateIndex(threshold)
+    index.add(video_fingerprint(frames), "/videos/clip.mp4")
+
+    # Another encode: every frame a few bits off
+    reencoded = [flip_bits(frame, threshold, rng) for frame in frames]
+    assert index.find(video_fingerprint(reencoded)) == "/videos/clip.mp4"
+
+    # Same middle frame, but one other frame is too different
+    for i in (0, 1, 3, 4):
+        other = list(frames)
+        other[i] = flip_bits(frames[i], threshold + 1, rng)
+        assert index.find(video_fingerprint(other)) is None
+
+    # Fewer sampled frames, or only the middle frame as a photo, never match
+    assert index.find(video_fingerprint(frames[1:4])) is None
+    assert index.find(hex_hash(frames[2])) is None
+
+
+def test_many_videos_sharing_a_middle_frame():
+    rng = random.Random(5)
+    middle = rng.getrandbits(64)
+    videos = [[rng.getrandbits(64), rng.getrandbits(64), middle, rng.getrandbits(64), rng.getrandbits(64)]
+              for _ in range(20)]
+    index = DuplicateIndex(2)
+    for i, frames in enumerate(videos):
+        index.add(video_fingerprint(frames), f"/videos/{i}.mp4")
+    for i, frames in enumerate(videos):
+        assert index.find(video_fingerprint(frames)) == f"/videos/{i}.mp4"
+
+
+def test_path_table_round_trip():
+    paths = PathTable()
+    names = ["/a/b.jpg", "/a/caf\udce9.jpg", "/a/b.jpg", "/x/été.png"]
+    ids = [paths.add(name) for name in names]
+    assert [paths[path_id] for path_id in ids] == names
+    # The same path twice in a row is stored once
+    assert paths.add("/x/été.png") == ids[-1]
+
+
+def test_exact_index_unique_sizes_are_never_read(tmp_path):
+    index = ExactDuplicateIndex()
+    for i in range(5):
+        path = tmp_path / f"{i}.jpg"
+        path.write_bytes(bytes(100 + i))
+        original, entry = index.lookup(str(path), 100 + i)
+        assert original is None
+        index.add(100 + i, entry)
+    assert index.bytes_read == 0
+
+
+def test_exact_index_same_size_different_content(tmp_path):
+    index = ExactDuplicateIndex()
+    data = np.random.RandomState(0).bytes(20000)
+    (tmp_path / "a.jpg").write_bytes(data)
+    # Same head and tail, different middle: only the full hash tells them apart
+    (tmp_path / "b.jpg").write_bytes(data[:10000] + b"x" + data[10001:])
+    (tmp_path / "c.jpg").write_bytes(data)
+    _, entry = index.lookup(str(tmp_path / "a.jpg"), len(data))
+    index.add(len(data), entry)
+    assert index.lookup(str(tmp_path / "b.jpg"), len(data))[0] is None
+    assert index.lookup(str(tmp_path / "c.jpg"), len(data))[0] == str(tmp_path / "a.jpg")
+
+
+def test_exact_index_reserved_files(tmp_path):
+    index = ExactDuplicateIndex()
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        (tmp_path / name).write_bytes(b"same bytes")
+    size = len(b"same bytes")
+
+    _, entry = index.lookup(str(tmp_path / "a.jpg"), size)
+    index.reserve(size, entry)
+    assert index.lookup(str(tmp_path / "b.jpg"), size)[0] == str(tmp_path / "a.jpg")
+
+    # Not valid media after all: copies no longer match it
+    index.release(size, entry)
+    assert index.lookup(str(tmp_path / "b.jpg"), size)[0] is None
+
+    index.reserve(size, entry)
+    index.add(size, entry)
+    assert not index.reserved
+    assert index.lookup(str(tmp_path / "c.jpg"), size)[0] == str(tmp_path / "a.jpg")
@@ -0,0 +1,106 @@
+import io
+import struct
+from datetime import datetime, timedelta, timezone
+
+from PIL import Image
+
+from exif_reader import (TAG_CREATE_DATE, TAG_DATETIME_ORIGINAL, TAG_EXIF_IFD, TAG_OFFSET_TIME_ORIGINAL,
+                         parse_exif_datetime, read_exif_date)
+
+
+def jpeg_bytes(exif_tags=None, **save_options):
+    exif = Image.Exif()
+    if exif_tags:
+        exif[TAG_EXIF_IFD] = exif_tags
+    out = io.BytesIO()
+    Image.new("RGB", (16, 16), "red").save(out, "JPEG", exif=exif, **save_options)
+    return out.getvalue()
+
+
+def tiff_bytes(endian, date):
+    """A minimal TIFF with only IFD0 and an EXIF IFD holding DateTimeOriginal."""
+    value = date.encode("ascii") + b"\x00"
+    header = (b"II*\x00" if endian == "<" else b"MM\x00*") + struct.pack(endian + "I", 8)
+    exif_ifd_offset = 8 + 2 + 12 + 4
+    date_offset = exif_ifd_offset + 2 + 12 + 4
+    ifd0 = struct.pack(endian + "H", 1) + struct.pack(endian + "HHII", TAG_EXIF_IFD, 4, 1, exif_ifd_offset) + bytes(4)
+    exif_ifd = (struct.pack(endian + "H", 1)
+                + struct.pack(endian + "HHII", TAG_DATETIME_ORIGINAL, 2, len(value), date_offset) + bytes(4))
+    return header + ifd0 + exif_ifd + value
+
+
+def test_parse_exif_datetime():
+    assert parse_exif_datetime("2019:07:04 18:30:05") == datetime(2019, 7, 4, 18, 30, 5)
+    assert parse_exif_datetime(b"2019:07:04 18:30:05\x00") == datetime(2019, 7, 4, 18, 30, 5)
+    assert parse_exif_datetime("2019:07:04 18:30:05", "+02:00") == datetime(
+        2019, 7, 4, 18, 30, 5, tzinfo=timezone(timedelta(hours=2)))
+    assert parse_exif_datetime("2019:07:04 18:30:05", "-05:30").utcoffset() == -timedelta(hours=5, minutes=30)
+
+
+def test_parse_exif_datetime_rejects_garbage():
+    assert parse_exif_datetime(None) is None
+    assert parse_exif_datetime("0000:00:00 00:00:00") is None
+    assert parse_exif_datetime("    :  :     :  :  ") is None
+    # A broken offset keeps the date
+    assert parse_exif_datetime("2019:07:04 18:30:05", "bogus") == datetime(2019, 7, 4, 18, 30, 5)
+
+
+def test_jpeg_date_time_original():
+    data = jpeg_bytes({TAG_DATETIME_ORIGINAL: "2018:03:02 10:11:12"})
+    assert read_exif_date(io.BytesIO(data)) == datetime(2018, 3, 2, 10, 11, 12)
+
+
+def test_jpeg_date_with_offset():
+    data = jpeg_bytes({TAG_DATETIME_ORIGINAL: "2018:03:02 10:11:12", TAG_OFFSET_TIME_ORIGINAL: "+01:00"})
+    assert read_exif_date(io.BytesIO(data)) == datetime(2018, 3, 2, 10, 11, 12,
+                                                        tzinfo=timezone(timedelta(hours=1)))
+
+
+def test_jpeg_falls_back_to_create_date():
+    data = jpeg_bytes({TAG_CREATE_DATE: "2017:01:01 00:00:01"})
+    assert read_exif_date(io.BytesIO(data)) == datetime(2017, 1, 1, 0, 0, 1)
+
+
+def test_jpeg_after_other_app_segments():
+    # JFIF APP0 and a comment before the EXIF segment
+    data = jpeg_bytes({TAG_DATETIME_ORIGINAL: "2016:05:06 07:08:09"})
+    comment = b"\xff\xfe" + struct.pack(">H", 2 + 300) + bytes(300)
+    data = data[:2] + comment + data[2:]
+    assert read_exif_date(io.BytesIO(data)) == datetime(2016, 5, 6, 7, 8, 9)
+
+
+def test_jpeg_without_exif():
+    out = io.BytesIO()
+    Image.new("RGB", (16, 16)).save(out, "JPEG")
+    assert read_exif_date(io.BytesIO(out.getvalue())) is None
+
+
+def test_tiff_both_byte_orders():
+    for endian in "<>":
+        data = tiff_bytes(endian, "2015:12:24 20:00:00")
+        assert read_exif_date(io.BytesIO(data)) == datetime(2015, 12, 24, 20, 0, 0)
+
+
+def test_truncated_files_do_not_raise():
+    for data in (jpeg_bytes({TAG_DATETIME_ORIGINAL: "2018:03:02 10:11:12"}),
+                 tiff_bytes(">", "2015:12:24 20:00:00")):
+        for cut in range(len(data)):
+            read_exif_date(io.BytesIO(data[:cut]))
+
+
+def test_huge_ifd_count_is_rejected():
+    data = bytearray(tiff_bytes("<", "2015:12:24 20:00:00"))
+    struct.pack_into("<H", data, 8, 60000)
+    assert read_exif_date(io.BytesIO(bytes(data))) is None
+
+
+def test_not_an_image():
+    assert read_exif_date(io.BytesIO(b"PK\x03\x04 not an image")) is None
+    assert read_exif_date(io.BytesIO(b"")) is None
+
+
+def test_read_from_file(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(jpeg_bytes({TAG_DATETIME_ORIGINAL: "2020:02:29 23:59:59"}))
+    with open(path, "rb") as f:
+        assert read_exif_date(f) == datetime(2020, 2, 29, 23, 59, 59)
@@ -0,0 +1,106 @@
+import os
+import sys
+import errno
+
+import pytest
+
+import file_transfer
+from file_transfer import FICLONE, PARTIAL_SUFFIX, TransferCanceled, transfer_file
+
+DATA = bytes(range(256)) * 4096
+
+
+def source(tmp_path, data=DATA):
+    path = tmp_path / "src.jpg"
+    path.write_bytes(data)
+    return str(path)
+
+
+def cross_device_link(src, dst):
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+
+def test_copy(tmp_path):
+    src = source(tmp_path)
+    dst = str(tmp_path / "dst.jpg")
+    assert transfer_file(src, dst) == "copy"
+    assert open(dst, "rb").read() == DATA
+    assert os.stat(dst).st_mtime_ns == os.stat(src).st_mtime_ns
+    assert not os.path.exists(dst + PARTIAL_SUFFIX)
+
+
+def test_never_overwrites(tmp_path):
+    src = source(tmp_path)
+    dst = tmp_path / "dst.jpg"
+    dst.write_bytes(b"keep")
+    for mode in file_transfer.TRANSFER_MODES:
+        with pytest.raises(FileExistsError):
+            transfer_file(src, str(dst), mode)
+    assert dst.read_bytes() == b"keep"
+    assert os.path.exists(src)
+
+
+def test_kernel_copy_copying_nothing_falls_back(tmp_path, monkeypatch):
+    # Some filesystems report 0 bytes copied instead of an error
+    monkeypatch.setattr(file_transfer, "_copy_file_range", lambda src_fd, dst_fd, count, offset: 0)
+    monkeypatch.setattr(file_transfer, "_sendfile_copy", lambda src_fd, dst_fd, count, offset: 0)
+    monkeypatch.setattr(file_transfer, "COPY_CHUNK_SIZE", 4096)
+    src = source(tmp_path)
+    dst = str(tmp_path / "dst.jpg")
+    transfer_file(src, dst)
+    assert open(dst, "rb").read() == DATA
+
+
+def test_short_copy_is_not_published(tmp_path, monkeypatch):
+    # The file shrank or the copy stopped early: nothing is published and a move keeps the source
+    monkeypatch.setattr(file_transfer, "_copy_data", lambda src_fd, dst_fd, size, cancel_check: size // 2)
+    monkeypatch.setattr(os, "link", cross_device_link)
+    src = source(tmp_path)
+    dst = str(tmp_path / "dst.jpg")
+    with pytest.raises(OSError):
+        transfer_file(src, dst, "move")
+    assert not os.path.exists(dst)
+    assert not os.path.exists(dst + PARTIAL_SUFFIX)
+    assert open(src, "rb").read() == DATA
+
+
+def test_cancel_removes_partial_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_transfer, "COPY_CHUNK_SIZE", 4096)
+    calls = []
+
+    def cancel_check():
+        calls.append(1)
+        return len(calls) > 2
+
+    src = source(tmp_path)
+    dst = str(tmp_path / "dst.jpg")
+    with pytest.raises(TransferCanceled):
+        transfer_file(src, dst, cancel_check=cancel_check)
+    assert not os.path.exists(dst)
+    assert not os.path.exists(dst + PARTIAL_SUFFIX)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="FICLONE is Linux only")
+def test_reflink_clones_under_temporary_name(tmp_path, monkeypatch):
+    import fcntl
+    src = source(tmp_path)
+    dst = str(tmp_path / "dst.jpg")
+
+    def clone(fd, request, src_fd):
+        # A run killed right here must not leave a file at dst
+        assert request == FICLONE
+        assert not os.path.exists(dst)
+        os.write(fd, os.pread(src_fd, len(DATA), 0))
+
+    monkeypatch.setattr(fcntl, "ioctl", clone)
+    assert transfer_file(src, dst, "reflink") == "reflink"
+    assert open(dst, "rb").read() == DATA
+    assert not os.path.exists(dst + PARTIAL_SUFFIX)
+
+
+def test_reflink_falls_back_to_copy(tmp_path):
+    src = source(tmp_path)
+    dst = str(tmp_path / "dst.jpg")
+    assert transfer_file(src, dst, "reflink") in ("reflink", "copy")
+    assert open(dst, "rb").read() == DATA
+    assert not os.path.exists(dst + PARTIAL_SUFFIX)
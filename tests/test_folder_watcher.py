@@ -0,0 +1,30 @@
+import os
+
+from folder_watcher import HandledFiles
+
+
+def test_handled_files_by_size_and_mtime(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"first")
+    handled = HandledFiles()
+    assert str(path) not in handled
+    handled.add(str(path))
+    assert str(path) in handled
+    assert str(tmp_path / "b.jpg") not in handled
+
+    # Edited in place after it was organized: handled again
+    path.write_bytes(b"second version")
+    assert str(path) not in handled
+
+    # Same size, only the modification time changed
+    handled.add(str(path))
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert str(path) not in handled
+
+
+def test_handled_files_gone(tmp_path):
+    handled = HandledFiles()
+    handled.add(str(tmp_path / "missing.jpg"))
+    assert len(handled) == 0
+    assert str(tmp_path / "missing.jpg") not in handled
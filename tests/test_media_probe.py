@@ -0,0 +1,46 @@
+import shutil
+
+from PIL import Image
+
+from duplicate_index import ExactDuplicateIndex
+from media_probe import iter_probed_media
+
+
+def make_files(tmp_path):
+    """Photos, one of them copied several times, and a broken file with copies of its own."""
+    candidates = []
+
+    def add(name):
+        candidates.append((str(tmp_path / name), name, "image"))
+
+    for i in range(6):
+        Image.new("RGB", (32, 32), (i * 40, 0, 0)).save(tmp_path / f"photo{i}.png")
+        add(f"photo{i}.png")
+        if i == 2:
+            # Copies right behind their original, inside the in-flight window of a pool
+            for k in range(3):
+                shutil.copy(tmp_path / "photo2.png", tmp_path / f"photo2_copy{k}.png")
+                add(f"photo2_copy{k}.png")
+    (tmp_path / "broken.png").write_bytes(b"not a png at all")
+    add("broken.png")
+    for k in range(2):
+        shutil.copy(tmp_path / "broken.png", tmp_path / f"broken_copy{k}.png")
+        add(f"broken_copy{k}.png")
+    return candidates
+
+
+def probe_all(candidates, workers):
+    results = iter_probed_media(candidates, True, workers=workers, exact_index=ExactDuplicateIndex())
+    return [(filename, info.valid, info.duplicate_of) for filename, info in results]
+
+
+def test_exact_copies_in_flight_match_their_original(tmp_path):
+    candidates = make_files(tmp_path)
+    results = probe_all(candidates, workers=1)
+    duplicates = {filename: duplicate_of for filename, _, duplicate_of in results if duplicate_of}
+    assert duplicates == {f"photo2_copy{k}.png": str(tmp_path / "photo2.png") for k in range(3)}
+    # Copies of a file that isn't valid media are looked at themselves
+    assert [valid for filename, valid, _ in results if filename.startswith("broken")] == [False] * 3
+
+    for workers in (2, 4):
+        assert probe_all(candidates, workers) == results
@@ -0,0 +1,73 @@
+import os
+
+from file_transfer import PARTIAL_SUFFIX
+from organize_plan import ACTION_ORGANIZE, PlanEntry, iter_apply_plan
+
+DATA = b"\xff\xd8 photo data" * 1000
+
+
+def setup(tmp_path):
+    source = tmp_path / "card" / "a.jpg"
+    source.parent.mkdir()
+    source.write_bytes(DATA)
+    target = tmp_path / "photos" / "2020" / "a.jpg"
+    entry = PlanEntry(ACTION_ORGANIZE, str(source), str(target), "image", None, None, len(DATA))
+    return source, target, entry
+
+
+def apply(entry, transfer_mode="copy", resumed=False):
+    resumed_sources = {entry.source: entry} if resumed else None
+    return list(iter_apply_plan([entry], transfer_mode, resumed_sources=resumed_sources))
+
+
+def test_apply(tmp_path):
+    source, target, entry = setup(tmp_path)
+    assert apply(entry) == [(entry, None)]
+    assert target.read_bytes() == DATA
+    assert source.exists()
+
+
+def test_existing_target_is_not_overwritten(tmp_path):
+    source, target, entry = setup(tmp_path)
+    target.parent.mkdir(parents=True)
+    target.write_bytes(b"someone else's file")
+    [(_, error)] = apply(entry)
+    assert isinstance(error, FileExistsError)
+    assert target.read_bytes() == b"someone else's file"
+
+
+def test_resumed_target_already_present(tmp_path):
+    # The transfer finished, but the crash came before the journal recorded it
+    source, target, entry = setup(tmp_path)
+    target.parent.mkdir(parents=True)
+    target.write_bytes(DATA)
+    assert apply(entry, resumed=True) == [(entry, None)]
+    assert target.read_bytes() == DATA
+    assert source.exists()
+
+
+def test_resumed_move_between_link_and_unlink(tmp_path):
+    source, target, entry = setup(tmp_path)
+    target.parent.mkdir(parents=True)
+    os.link(source, target)
+    assert apply(entry, "move", resumed=True) == [(entry, None)]
+    assert not source.exists()
+    assert target.read_bytes() == DATA
+
+
+def test_resumed_move_keeps_a_source_that_is_another_file(tmp_path):
+    # Not provably the same file, e.g. a copy+delete across filesystems: never delete the source
+    source, target, entry = setup(tmp_path)
+    target.parent.mkdir(parents=True)
+    target.write_bytes(DATA)
+    assert apply(entry, "move", resumed=True) == [(entry, None)]
+    assert source.exists()
+
+
+def test_resumed_copy_that_only_left_a_partial_file(tmp_path):
+    source, target, entry = setup(tmp_path)
+    target.parent.mkdir(parents=True)
+    (tmp_path / "photos" / "2020" / ("a.jpg" + PARTIAL_SUFFIX)).write_bytes(DATA[:100])
+    assert apply(entry, resumed=True) == [(entry, None)]
+    assert target.read_bytes() == DATA
+    assert not os.path.exists(str(target) + PARTIAL_SUFFIX)
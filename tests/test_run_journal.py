@@ -0,0 +1,87 @@
+from organize_plan import ACTION_DUPLICATE, ACTION_ORGANIZE, PlanEntry
+from run_journal import RunJournal, replay_journal
+
+SOURCE_DIR = "/media/card"
+
+
+def entry(name, action=ACTION_ORGANIZE):
+    return PlanEntry(action, f"{SOURCE_DIR}/{name}", f"/photos/2020/01-January/Photos/{name}", "image",
+                     None, "00ff00ff00ff00ff", 1234)
+
+
+def write_journal(path, entries, done=(), failed=()):
+    journal = RunJournal(str(path), SOURCE_DIR)
+    for e in entries:
+        journal.decide(e)
+    for e in done:
+        journal.done(e.source)
+    for e in failed:
+        journal.failed(e.source, OSError("disk full"))
+    journal.close()
+
+
+def test_replay_decisions_and_done(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    entries = [entry("a.jpg"), entry("b.jpg", ACTION_DUPLICATE), entry("c.jpg")]
+    write_journal(path, entries, done=entries[:2])
+    state = replay_journal(str(path), SOURCE_DIR)
+    assert list(state.decisions.values()) == entries
+    assert state.done == {entries[0].source, entries[1].source}
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    entries = [entry("a.jpg"), entry("b.jpg")]
+    write_journal(path, entries, done=entries[:1])
+    # Killed in the middle of writing a record
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "done", "source": "%s' % entries[1].source)
+    state = replay_journal(str(path), SOURCE_DIR)
+    assert list(state.decisions.values()) == entries
+    assert state.done == {entries[0].source}
+
+
+def test_failed_transfers_are_not_done(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    a, b, c = entry("a.jpg"), entry("b.jpg"), entry("c.jpg")
+    journal = RunJournal(str(path), SOURCE_DIR)
+    for e in (a, b, c):
+        journal.decide(e)
+    journal.done(a.source)
+    journal.failed(b.source, OSError("disk full"))
+    # A failure after a success, and a success on retry
+    journal.done(c.source)
+    journal.failed(c.source, OSError("target vanished"))
+    journal.close()
+    journal = RunJournal(str(path), SOURCE_DIR, resume=True)
+    journal.done(b.source)
+    journal.close()
+
+    state = replay_journal(str(path), SOURCE_DIR)
+    assert state.done == {a.source, b.source}
+    assert set(state.decisions) == {a.source, b.source, c.source}
+
+
+def test_other_source_or_no_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    write_journal(path, [entry("a.jpg")])
+    assert replay_journal(str(path), "/media/other-card") is None
+    assert replay_journal(str(tmp_path / "missing.jsonl"), SOURCE_DIR) is None
+
+
+def test_paths_that_are_not_utf8(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    e = entry("caf\udce9.jpg")
+    write_journal(path, [e], done=[e])
+    state = replay_journal(str(path), SOURCE_DIR)
+    assert state.decisions == {e.source: e}
+    assert state.done == {e.source}
+
+
+def test_finish_removes_the_journal(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = RunJournal(str(path), SOURCE_DIR)
+    journal.decide(entry("a.jpg"))
+    journal.finish()
+    assert not path.exists()
+    assert replay_journal(str(path), SOURCE_DIR) is None
@@ -0,0 +1,98 @@
+import os
+import fnmatch
+
+import pytest
+
+from media_probe import MediaInfo
+from media_scanner import scan_media_files
+from shard_plan import (ShardWriter, iter_merged_shards, open_shards, relative_source_path, scan_order_key,
+                        shard_cache_path, shard_filename, shard_of)
+
+# Names that sort differently as whole paths than per directory level
+TREE = [
+    "z.jpg", "A.jpg", "a.jpg", "a b.jpg", "a-b.jpg", "a.b.jpg", "_x.png", "10.jpg", "9.jpg",
+    "a/1.jpg", "a/z.mp4", "a/b/c.jpg", "a/b/c/d.jpg", "a/b-c/e.jpg", "a/b c/f.jpg", "a/b.c/g.jpg",
+    "a b/h.jpg", "a-b/i.jpg", "a.b/j.jpg", "B/k.jpg", "b/l.jpg", "b/a/m.jpg", "b/a b/n.jpg",
+    "caf\udce9/o.jpg", "café/p.jpg", "deep/1/2/3/4/q.jpg", "deep/1/2/r.jpg", "deep/1/s.jpg",
+]
+
+
+@pytest.fixture
+def source(tmp_path):
+    root = tmp_path / "source"
+    for relative in TREE:
+        path = os.path.join(os.fsencode(str(root)), os.fsencode(relative))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(relative.encode("utf-8", "surrogateescape"))
+    return str(root)
+
+
+def scanned(source):
+    return [relative_source_path(path, source) for path, _, _ in scan_media_files(source)]
+
+
+def test_scan_order_key_matches_scan_order(source):
+    order = scanned(source)
+    assert sorted(order) == sorted(TREE)
+    assert sorted(order, key=scan_order_key) == order
+
+
+def info(path, size=100):
+    return MediaInfo(path, "image", True, 2020, 1, "00ff00ff00ff00ff", 16, 16, size, None)
+
+
+@pytest.mark.parametrize("shard_by", ["hash", "subtree"])
+def test_merged_shards_come_back_in_scan_order(source, tmp_path, shard_by):
+    shards = 3
+    order = scanned(source)
+    writers = [ShardWriter(str(tmp_path / shard_filename(shard, shards)), shard, shards, shard_by, source, True)
+               for shard in range(shards)]
+    # Each shard in scan order, like build_shard writes them
+    for relative in order:
+        writers[shard_of(relative, shards, shard_by)].add(relative, info(os.path.join(source, relative)))
+    for writer in writers:
+        writer.finish()
+
+    readers = open_shards([str(tmp_path / shard_filename(shard, shards)) for shard in range(shards)])
+    try:
+        merged = [file_path for file_path, _, _, _ in iter_merged_shards(readers, source)]
+    finally:
+        for reader in readers:
+            reader.close()
+    assert merged == [os.path.join(source, *relative.split("/")) for relative in order]
+
+
+def test_subtree_keeps_top_level_directories_together():
+    for relative in TREE:
+        top = relative.split("/", 1)[0]
+        assert shard_of(relative, 4, "subtree") == shard_of(top, 4, "subtree")
+
+
+def test_only_complete_shards_match_a_glob(tmp_path):
+    shard_path = str(tmp_path / shard_filename(0, 2))
+    writer = ShardWriter(shard_path, 0, 2, "hash", "/media/card", True)
+    writer.add("a.jpg", info("/media/card/a.jpg"))
+    open(shard_cache_path(shard_path), "wb").close()
+
+    # Neither the cache nor the unfinished shard look like shards
+    assert fnmatch.filter(os.listdir(tmp_path), "organize_shard_*") == []
+    writer.finish()
+    assert fnmatch.filter(os.listdir(tmp_path), "organize_shard_*") == [shard_filename(0, 2)]
+
+
+def test_incomplete_or_missing_shards_are_rejected(tmp_path):
+    paths = [str(tmp_path / shard_filename(shard, 3)) for shard in range(3)]
+    for shard, path in enumerate(paths):
+        writer = ShardWriter(path, shard, 3, "hash", "/media/card", True)
+        writer.finish()
+    with pytest.raises(ValueError, match="Missing shards: 3"):
+        open_shards(paths[:2])
+    with pytest.raises(ValueError, match="more than once"):
+        open_shards(paths + paths[:1])
+
+    # Cut off before the summary line
+    with open(paths[2], "rb+") as f:
+        f.truncate(os.path.getsize(paths[2]) - 10)
+    with pytest.raises(ValueError):
+        open_shards(paths)
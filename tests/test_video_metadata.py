@@ -0,0 +1,126 @@
+import struct
+from datetime import datetime, timedelta, timezone
+
+from video_metadata import MATROSKA_EPOCH, MP4_EPOCH, read_video_creation_date
+
+CREATED = datetime(2021, 6, 15, 12, 30, 0, tzinfo=timezone.utc)
+
+
+def box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mvhd(created, version=0):
+    seconds = int((created - MP4_EPOCH).total_seconds())
+    if version == 1:
+        return box(b"mvhd", bytes([1, 0, 0, 0]) + struct.pack(">QQ", seconds, seconds) + bytes(80))
+    return box(b"mvhd", bytes(4) + struct.pack(">II", seconds, seconds) + bytes(80))
+
+
+def mp4(*boxes):
+    return box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2") + b"".join(boxes)
+
+
+def ebml_element(element_id, payload):
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    # 8-byte size, marker bit in the first byte
+    return id_bytes + (0x01 << 56 | len(payload)).to_bytes(8, "big") + payload
+
+
+def matroska(*segment_children):
+    header = ebml_element(0x1A45DFA3, ebml_element(0x4282, b"matroska"))
+    return header + ebml_element(0x18538067, b"".join(segment_children))
+
+
+def date_utc(created):
+    nanoseconds = int((created - MATROSKA_EPOCH).total_seconds()) * 1000000000
+    return ebml_element(0x4461, struct.pack(">q", nanoseconds))
+
+
+def write(tmp_path, data, name="clip.mp4"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_mp4_creation_date(tmp_path):
+    path = write(tmp_path, mp4(box(b"moov", mvhd(CREATED))))
+    assert read_video_creation_date(path) == CREATED
+
+
+def test_mp4_version_1_mvhd(tmp_path):
+    path = write(tmp_path, mp4(box(b"moov", mvhd(CREATED, version=1))))
+    assert read_video_creation_date(path) == CREATED
+
+
+def test_mp4_moov_after_media_data(tmp_path):
+    path = write(tmp_path, mp4(box(b"mdat", bytes(5000)), box(b"moov", mvhd(CREATED))))
+    assert read_video_creation_date(path) == CREATED
+
+
+def test_mp4_64_bit_box_size(tmp_path):
+    media = bytes(100)
+    large_mdat = struct.pack(">I4sQ", 1, b"mdat", 16 + len(media)) + media
+    path = write(tmp_path, mp4(large_mdat, box(b"moov", mvhd(CREATED))))
+    assert read_video_creation_date(path) == CREATED
+
+
+def test_mp4_unset_creation_date(tmp_path):
+    path = write(tmp_path, mp4(box(b"moov", mvhd(MP4_EPOCH))))
+    assert read_video_creation_date(path) is None
+
+
+def test_mp4_without_moov(tmp_path):
+    path = write(tmp_path, mp4(box(b"mdat", bytes(100))))
+    assert read_video_creation_date(path) is None
+
+
+def test_mp4_truncated_inside_mvhd(tmp_path):
+    data = mp4(box(b"moov", mvhd(CREATED)))
+    # Cut before the end of the creation time, version and flags come first
+    payload = len(data) - 92
+    for cut in range(payload, payload + 8):
+        path = write(tmp_path, data[:cut])
+        assert read_video_creation_date(path) is None
+
+
+def test_mp4_truncated_anywhere(tmp_path):
+    data = mp4(box(b"mdat", bytes(64)), box(b"moov", mvhd(CREATED, version=1)))
+    for cut in range(len(data)):
+        path = write(tmp_path, data[:cut])
+        read_video_creation_date(path)
+
+
+def test_matroska_creation_date(tmp_path):
+    info = ebml_element(0x1549A966, date_utc(CREATED))
+    path = write(tmp_path, matroska(info), "clip.mkv")
+    assert read_video_creation_date(path) == CREATED
+
+
+def test_matroska_without_date(tmp_path):
+    info = ebml_element(0x1549A966, ebml_element(0x2AD7B1, struct.pack(">I", 1000000)))
+    path = write(tmp_path, matroska(info), "clip.mkv")
+    assert read_video_creation_date(path) is None
+
+
+def test_matroska_cluster_before_info(tmp_path):
+    cluster = ebml_element(0x1F43B675, bytes(32))
+    info = ebml_element(0x1549A966, date_utc(CREATED))
+    path = write(tmp_path, matroska(cluster, info), "clip.mkv")
+    assert read_video_creation_date(path) is None
+
+
+def test_matroska_truncated_anywhere(tmp_path):
+    data = matroska(ebml_element(0x1549A966, date_utc(CREATED + timedelta(seconds=1))))
+    for cut in range(len(data)):
+        path = write(tmp_path, data[:cut], "clip.mkv")
+        read_video_creation_date(path)
+
+
+def test_unknown_container(tmp_path):
+    path = write(tmp_path, b"RIFF\x00\x00\x00\x00AVI LIST" + bytes(64), "clip.avi")
+    assert read_video_creation_date(path) is None
+
+
+def test_missing_file(tmp_path):
+    assert read_video_creation_date(str(tmp_path / "missing.mp4")) is None